@@ -1,44 +1,20 @@
 import os
-import time
-import threading
-import struct
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-from PIL import Image, ImageTk, ImageOps
-import numpy as np
-
-# ===================== UTILITY FUNCTIONS ==================
-
-# Converts a list of binary values (0/1) into bytes (8 bits per byte).
-def packbits_py(bitlist):
-    out = bytearray()
-    n = len(bitlist)
-    for i in range(0, n, 8):
-        byte = 0
-        for j in range(8):
-            if i + j < n:
-                byte |= (bitlist[i + j] & 1) << (7 - j) 
-        out.append(byte)
-    return out
-
-# Expands a bytearray into a list of bits (0/1), optionally limited by total_bits.
-def unpackbits_py(bytearr, total_bits=None):
-    out = []
-    for byte in bytearr:
-        for i in range(7, -1, -1):
-            out.append((byte >> i) & 1)
-    if total_bits is not None:
-        out = out[:total_bits]
-    return out
-
-# Formats a byte count into a human-readable string (KB or MB).
-def fmt_size(n_bytes):
-    kb = n_bytes / 1024
-    if kb < 1024:
-        return f"{kb:,.2f} KB"
-    else:
-        mb = kb / 1024
-        return f"{mb:,.2f} MB"
+from PIL import Image, ImageTk
+import myimg_codec
+import myimg_effects
+import myimg_jobs
+import myimg_loader
+from myimg_codec import fmt_size
+from myimg_cli import COMPRESS_MODES
+from myimg_profile import StageProfile, stage
+
+
+# Progress bar refresh interval (about 30 frames per second).
+PROGRESS_FRAME_MS = 33
+# Largest size of the image preview.
+PREVIEW_SIZE = (330, 330)
 
 
 # ===================== MAIN APPLICATION CLASS AND FUNCTIONALITY =====================
@@ -67,11 +43,29 @@ class ImageCompressorApp(tk.Tk):
         self.compressed_data = None
         self.decompressed_image = None
         self.compressed_size = 0
-        self.edit_applied = False
+        self.preview_image = None
+        self.previews = myimg_loader.PreviewCache()
+        self.effects = []
         self.compressed_saved = False
+        self.prefetch_job = None
+        self.prefetched_image = None
+        self.prefetch_error = None
+        self.decompress_requested = False
+        self.profile = None
+        # Interactive operations (compress, background decode) share a small pool of threads, as
+        # they work on the images in memory. Batch jobs get their own pool of worker processes,
+        # so a long batch never delays the image on screen and its LZW jobs run in parallel
+        # without taking the GIL from the Tk thread.
+        self.jobs = myimg_jobs.JobQueue(workers=2)
+        self.current_job = None
+        self.progress_poll = None
+        self.batch_jobs = myimg_jobs.JobQueue(processes=True)
+        self.batch_window = None
+        self.closed = False
 
         self.init_ui()
         self.create_static_buttons()
+        self.protocol("WM_DELETE_WINDOW", self.close)
         
     # Builds the GUI: styles, title, top menu, file buttons, status labels, and progress bar.
     def init_ui(self):
@@ -91,6 +85,11 @@ class ImageCompressorApp(tk.Tk):
         self.help_button = ttk.Button(self.topbar, text="Help", width=5, style='Help.TButton', command=self.show_help)
         self.help_button.pack(side="right", padx=8)
 
+        self.profile_var = tk.BooleanVar(value=False)
+        self.profile_check = tk.Checkbutton(self.topbar, text="Profile stages", variable=self.profile_var, font=("Segoe UI", 9),
+                                            bg=self.light_bg, fg="#003366", activebackground=self.light_bg, selectcolor="white")
+        self.profile_check.pack(side="right", padx=4)
+
         self.title_label = tk.Label(self, text="BetuIMG Studio", font=("Segoe UI", 18, "bold"), bg=self.light_bg, fg="#003366")
         self.title_label.pack(pady=5)
 
@@ -106,6 +105,8 @@ class ImageCompressorApp(tk.Tk):
         edit_menu.add_command(label="Convert to Grayscale", command=self.convert_image_to_grayscale)
         edit_menu.add_command(label="Invert Colors", command=self.invert_image)
         edit_menu.add_command(label="Apply Sepia Effect", command=self.apply_sepia)
+        edit_menu.add_separator()
+        edit_menu.add_command(label="Undo Last Effect", command=self.undo_effect)
         edit_button["menu"] = edit_menu
         edit_button.pack(side="left", padx=6)
         ttk.Button(self.top_frame, text="Compress (Lossless)", command=self.compress_image_lossless).pack(side="left", padx=6)
@@ -118,6 +119,7 @@ class ImageCompressorApp(tk.Tk):
         ttk.Button(self.bottom_frame, text="Load .myimg", command=self.load_file, width=17).pack(side="left", padx=10)
         ttk.Button(self.bottom_frame, text="Decompress", command=self.decompress_image, width=17).pack(side="left", padx=10)
         ttk.Button(self.bottom_frame, text="Save as PNG", command=self.save_decompressed_image, width=17).pack(side="left", padx=10)
+        ttk.Button(self.bottom_frame, text="Batch Jobs", command=self.open_batch_jobs, width=17).pack(side="left", padx=10)
 
         self.status = tk.Label(self, text="", font=("Segoe UI", 10, 'italic', "bold"), bg=self.light_bg, fg="#333")
         self.status.pack(pady=(10, 0))
@@ -130,6 +132,7 @@ class ImageCompressorApp(tk.Tk):
 
         self.progress_label = tk.Label(self, text="", font=("Segoe UI", 9), bg=self.light_bg, fg="#003366")
         self.progress = ttk.Progressbar(self, orient="horizontal", length=360, mode="determinate", style="blue.Horizontal.TProgressbar")
+        self.cancel_button = ttk.Button(self, text="Cancel", command=self.cancel_current_job)
 
     # Creates persistent elements: theme toggle (light/dark) and Reset/Exit buttons.
     def create_static_buttons(self):
@@ -156,15 +159,21 @@ class ImageCompressorApp(tk.Tk):
         path = filedialog.askopenfilename(filetypes=filetypes)
         if not path:
             return
+        self.cancel_jobs()
         self.image = Image.open(path)
+        self.preview_image = self.previews.get(path, PREVIEW_SIZE)
+        self.effects = []
         self.image_path = path
         self.compressed_data = None
         self.decompressed_image = None
+        self.prefetched_image = None
+        self.prefetch_error = None
+        self.decompress_requested = False
+        self.profile = None
         self.file_label.config(text=f"{os.path.basename(path)} (Original Image)")
         self.status.config(text=f"Image loaded: {os.path.basename(path)}")
         self.metrics.config(text="")
-        self.update_preview(self.image)
-        self.edit_applied = False
+        self.update_preview(self.preview_image)
         self.compressed_saved = False
 
     # Loads a previously saved .myimg compressed file.
@@ -174,18 +183,36 @@ class ImageCompressorApp(tk.Tk):
         if path:
             self.metrics.config(text="") 
             with open(path, "rb") as f:
-                self.compressed_data = f.read()
+                data = f.read()
+            try:
+                myimg_file = myimg_codec.read_container(data)
+            except ValueError as e:
+                messagebox.showerror("Invalid .myimg File", f"This file cannot be decompressed:\n{e}")
+                return
+            self.cancel_jobs()
+            self.compressed_data = data
             self.compressed_size = len(self.compressed_data)
             self.image = None
+            self.preview_image = None
+            self.effects = []
             self.decompressed_image = None
             self.file_label.config(text=f"{os.path.basename(path)} (Compressed Image)")
             self.preview.config(image="")
             self.preview.image = None
             self.status.config(text=f"Compressed file loaded: {os.path.basename(path)}")
             self.last_myimg_filename = os.path.basename(path)
-            self.edit_applied = False
             self.compressed_saved = False
             self.image_path = None 
+            if myimg_file.mode in myimg_codec.BTC_MODES:
+                self.show_block_preview(myimg_file)
+            self.start_prefetch(myimg_file)
+
+    # Shows the instant mean-color preview of a lossy file (one pixel per block, scaled to the preview size).
+    def show_block_preview(self, myimg_file):
+        thumb = myimg_codec.decode_thumbnail(myimg_file)
+        size = myimg_loader.fit_size((myimg_file.width, myimg_file.height), PREVIEW_SIZE)
+        self.update_preview(thumb.resize(size, Image.Resampling.BILINEAR))
+        self.status.config(text=f"Compressed file loaded: {self.last_myimg_filename} (quick preview)")
     
     # Saves the current compressed data to a file with the .myimg extension.
     # Warns the user if no compression has been performed yet.
@@ -202,7 +229,6 @@ class ImageCompressorApp(tk.Tk):
                 self.preview.image = None
                 self.file_label.config(text="")
                 self.metrics.config(text="")
-                self.edit_applied = False
                 self.compressed_saved = True
         else:
             messagebox.showwarning("No Compressed Data", "There is no compressed image to save.\nPlease compress an image first.")
@@ -219,22 +245,16 @@ class ImageCompressorApp(tk.Tk):
                 self.preview.config(image="")
                 self.preview.image = None
                 self.file_label.config(text="")
-                self.edit_applied = False
         else:
             messagebox.showwarning("No Decompressed Image", "There is no decompressed image to save.\nPlease decompress an image first.")
     
 
     # ===================== IMAGE PREVIEW AND PROGRESS HANDLING =====================
 
-    # Displays a thumbnail preview of the given image in the GUI.
+    # Displays a thumbnail preview of the given image in the GUI. Images that already fit are
+    # shown as they are; larger ones are shrunk without a full-size copy.
     def update_preview(self, img):
-        preview_size = (330, 330)
-        if img.mode != "RGB":
-            img_copy = img.convert("RGB")
-        else:
-            img_copy = img.copy()
-        img_copy.thumbnail(preview_size)
-        img_tk = ImageTk.PhotoImage(img_copy)
+        img_tk = ImageTk.PhotoImage(myimg_loader.make_preview(img, PREVIEW_SIZE))
         self.preview.configure(image=img_tk)
         self.preview.image = img_tk
 
@@ -243,14 +263,22 @@ class ImageCompressorApp(tk.Tk):
         if not self.progress_label.winfo_ismapped():
             self.progress_label.pack(before=self.preview, pady=(0, 0))
         if not self.progress.winfo_ismapped():
-            self.progress.pack(before=self.preview, pady=(0, 10))
+            self.progress.pack(before=self.preview, pady=(0, 4))
+        if not self.cancel_button.winfo_ismapped():
+            self.cancel_button.pack(before=self.preview, pady=(0, 10))
         self.progress_label.config(text="0%")
         self.progress["value"] = 0
+        if self.progress_poll is None:
+            self.progress_poll = self.after(PROGRESS_FRAME_MS, self.poll_progress)
 
     # Hides the progress bar and percentage label after the task is finished.
     def hide_progress(self):
+        if self.progress_poll is not None:
+            self.after_cancel(self.progress_poll)
+            self.progress_poll = None
         self.progress_label.pack_forget()
         self.progress.pack_forget()
+        self.cancel_button.pack_forget()
 
     # Gradually updates the progress bar by calling update_progress() until completion, then executes callback.
     def simulate_progress(self, callback):
@@ -272,20 +300,96 @@ class ImageCompressorApp(tk.Tk):
             self.after(200, self.hide_progress)
             callback()
 
-    # Safely updates progress bar and label from background threads.
-    def update_progressbar_safe(self, value):
-        self.after(0, lambda: (self.progress.config(value=value), self.progress_label.config(text=f"{value}%")))
+    # Shows the progress of the running job, once per frame while the progress bar is visible.
+    # The worker only stores its latest percentage in job.progress, so however often the codec
+    # reports, the Tk event queue gets one redraw per frame at most.
+    def poll_progress(self):
+        job = self.current_job
+        if job is not None and job.progress != self.progress["value"]:
+            self.progress.config(value=job.progress)
+            self.progress_label.config(text=f"{job.progress}%")
+        self.progress_poll = self.after(PROGRESS_FRAME_MS, self.poll_progress)
+
+
+    # ===================== BACKGROUND JOBS =====================
+
+    # Runs func(*args, **kwargs) on the interactive job pool; on_done(job) is then called on the
+    # Tk thread. While the job is current_job, poll_progress shows its progress.
+    def submit_job(self, name, func, *args, on_done, **kwargs):
+        return self.jobs.submit(name, func, *args, on_done=lambda job: self.hand_over(on_done, job), **kwargs)
+
+    # Schedules on_done(job) on the Tk thread, unless the window has been closed meanwhile.
+    def hand_over(self, on_done, job):
+        if self.closed:
+            return
+        try:
+            self.after(0, on_done, job)
+        except tk.TclError:
+            pass  # closed between the check and the call
+
+    # Cancels the operation shown in the progress bar (its codec stops at the next progress step).
+    def cancel_current_job(self):
+        if self.current_job is not None:
+            self.status.config(text="Cancelling...")
+            self.jobs.cancel(self.current_job)
+
+    # Cancels and forgets the running operations of the current image; their results are discarded.
+    def cancel_jobs(self):
+        for job in (self.current_job, self.prefetch_job):
+            if job is not None:
+                self.jobs.cancel(job)
+        self.current_job = None
+        self.prefetch_job = None
+        self.jobs.clear_finished()
+        self.hide_progress()
+
+    # Tells the user to wait when an operation is already running; returns True if one is.
+    def job_running(self):
+        if self.current_job is None:
+            return False
+        messagebox.showinfo("Operation Running", "Another operation is still running.\nPlease wait for it to finish or cancel it.")
+        return True
+
+    # Handles a finished compression job: stores the data and calls on_success, or reports the
+    # failure or cancellation. Results of jobs that were replaced or reset are ignored.
+    def on_compress_job_done(self, job, on_success):
+        if job is not self.current_job:
+            return
+        self.current_job = None
+        self.jobs.clear_finished()
+        if job.state == myimg_jobs.DONE:
+            self.compressed_data = job.result
+            on_success()
+            return
+        self.hide_progress()
+        self.profile = None
+        if job.state == myimg_jobs.CANCELLED:
+            self.status.config(text="Compression cancelled.")
+        else:
+            self.status.config(text=f"Compression failed: {job.error}")
+
+    # Opens (or raises) the batch job window.
+    def open_batch_jobs(self):
+        if self.batch_window is not None and self.batch_window.winfo_exists():
+            self.batch_window.lift()
+            return
+        self.batch_window = BatchJobsWindow(self)
 
 
     # ===================== LOSSLESS COMPRESSION & DECOMPRESSION =====================
 
     # Starts the lossless compression process in a background thread using LZW.
     def compress_image_lossless(self):
+        if self.job_running():
+            return
         if self.image and self.compressed_data is None and self.decompressed_image is None:
             self.status.config(text="Compressing (Lossless)...")
             self.show_progress()
             self.compressed_saved = False 
-            threading.Thread(target=self.compress_image_lossless_thread, daemon=True).start()
+            self.profile = self.new_profile()
+            self.current_job = self.submit_job(
+                "Compress (Lossless)", self.encode_edited, myimg_codec.encode_lossless, self.image, list(self.effects),
+                mode=myimg_codec.MODE_LOSSLESS_STRIPS, profile=self.profile, on_done=lambda job: self.on_compress_job_done(job, self.on_compress_lossless_done))
         elif self.image is None:
             messagebox.showwarning("No Image", "Please load an image before attempting compression.")
         elif self.compressed_data is not None:
@@ -301,50 +405,6 @@ class ImageCompressorApp(tk.Tk):
         else:
             messagebox.showwarning("No Image", "Please load an image before attempting compression.")
 
-    # Applies LZW-based lossless compression to the image and stores the result.
-    def compress_image_lossless_thread(self):
-        try:
-            pal_img = self.image.convert("P", palette=Image.Palette.ADAPTIVE, colors=256)
-            arr = np.array(pal_img)
-            pixel_bytes = arr.tobytes()
-            total_steps = len(pixel_bytes)
-            dict_size = 256
-            max_dict_size = 4096
-            dictionary = {bytes([i]): i for i in range(dict_size)}
-            w = b""
-            output = []
-            step_counter = 0
-
-            for c in pixel_bytes:
-                wc = w + bytes([c])
-                if wc in dictionary:
-                    w = wc
-                else:
-                    output.append(dictionary[w])
-                    if dict_size < max_dict_size:
-                        dictionary[wc] = dict_size
-                        dict_size += 1
-                    w = bytes([c])
-                step_counter += 1
-                if step_counter % 5000 == 0 or step_counter == total_steps:
-                    progress = int((step_counter / total_steps) * 100)
-                    self.update_progressbar_safe(progress)
-            if w:
-                output.append(dictionary[w])
-
-            out_bytes = bytearray()
-            for code in output:
-                out_bytes += code.to_bytes(2, 'big')
-            palette_bytes = bytes(pal_img.getpalette()[:256*3])
-            palette_bytes = palette_bytes + bytes(768 - len(palette_bytes))
-            w_img, h_img = arr.shape[1], arr.shape[0]
-            header = struct.pack(">BHH", 0, w_img, h_img)
-            self.compressed_data = header + palette_bytes + out_bytes
-
-            self.after(0, self.on_compress_lossless_done)
-        except Exception as e:
-            self.after(0, lambda: self.status.config(text=f"Compression failed: {e}"))
-    
     # Finalizes lossless compression: updates UI and shows statistics.
     def on_compress_lossless_done(self):
         self.compressed_size = len(self.compressed_data)
@@ -357,58 +417,19 @@ class ImageCompressorApp(tk.Tk):
         self.file_label.config(text="")
         self.show_compression_stats()
 
-    # Runs lossless decompression and updates the interface upon completion.
-    def decompress_lossless_thread(self):
-        try:
-            img = self.decompress_lossless_progress(self.compressed_data)
-            self.decompressed_image = img
-            self.after(0, self.on_decompress_done)
-        except Exception as e:
-            self.after(0, lambda: self.status.config(text=f"Decompression failed: {e}"))
-
-    # Reconstructs the original image from LZW-compressed data and palette information.
-    def decompress_lossless_progress(self, data):
-        if len(data) < 5+768:
-            raise ValueError("Invalid compressed file format")
-        header, content = data[:5], data[5:]
-        mode, w, h = struct.unpack(">BHH", header)
-        palette = list(content[:768])
-        compressed = content[768:]
-        dict_size = 256
-        dictionary = {i: bytes([i]) for i in range(dict_size)}
-        codes = [int.from_bytes(compressed[i:i+2], 'big') for i in range(0, len(compressed), 2)]
-        result = bytearray()
-        w_seq = dictionary[codes[0]]
-        result += w_seq
-        steps = len(codes)
-        for idx, k in enumerate(codes[1:], start=1):
-            if k in dictionary:
-                entry = dictionary[k]
-            elif k == dict_size:
-                entry = w_seq + w_seq[:1]
-            else:
-                raise ValueError("Invalid LZW code: %d" % k)
-            result += entry
-            dictionary[dict_size] = w_seq + entry[:1]
-            dict_size += 1
-            w_seq = entry
-            if idx % 5000 == 0 or idx == steps - 1:
-                self.update_progressbar_safe(int((idx / steps) * 100))
-                time.sleep(0.001)
-        arr = np.frombuffer(result, dtype='uint8').reshape((h, w))
-        pal_img = Image.fromarray(arr, mode='P')
-        pal_img.putpalette(palette)
-        return pal_img.convert('RGB')
-
-
     # ===================== LOSSY COMPRESSION & DECOMPRESSION =====================
 
     # Starts the lossy compression process using block-wise color approximation.
     def compress_image_lossy(self):
+        if self.job_running():
+            return
         if self.image and self.compressed_data is None and self.decompressed_image is None:
             self.status.config(text="Compressing (Lossy)...")
             self.show_progress()
-            threading.Thread(target=self.compress_image_lossy_thread, daemon=True).start()
+            self.profile = self.new_profile()
+            self.current_job = self.submit_job(
+                "Compress (Lossy)", self.encode_edited, myimg_codec.encode_lossy, self.image, list(self.effects), profile=self.profile,
+                on_done=lambda job: self.on_compress_job_done(job, self.on_compress_lossy_done))
             self.compressed_saved = False
         elif self.image is None:
             messagebox.showwarning("No Image", "Please load an image before attempting compression.")
@@ -426,53 +447,6 @@ class ImageCompressorApp(tk.Tk):
         else:
             messagebox.showwarning("No Image","Please load an image before attempting compression.")
 
-    # Performs lossy image compression using block-wise average color masking and bit packing.
-    def compress_image_lossy_thread(self):
-        try:
-            arr = np.array(self.image.convert("RGB"))
-            h, w, _ = arr.shape
-            block_size = 16
-            blocks_y = (h + block_size - 1) // block_size
-            blocks_x = (w + block_size - 1) // block_size
-            blocks = []
-
-            total_blocks = blocks_y * blocks_x
-            block_index = 0
-
-            for by in range(blocks_y):
-                for bx in range(blocks_x):
-                    y0, y1 = by * block_size, min((by + 1) * block_size, h)
-                    x0, x1 = bx * block_size, min((bx + 1) * block_size, w)
-                    block = arr[y0:y1, x0:x1].reshape(-1, 3)
-
-                    gray = (0.2989 * block[:, 0] + 0.587 * block[:, 1] + 0.114 * block[:, 2])
-                    mean = gray.mean()
-                    mask = (gray >= mean).astype(np.uint8)
-
-                    los, his = [], []
-                    for ch in range(3):
-                        ch_vals = block[:, ch]
-                        hi = ch_vals[mask == 1].mean() if np.any(mask == 1) else ch_vals.mean()
-                        lo = ch_vals[mask == 0].mean() if np.any(mask == 0) else ch_vals.mean()
-                        los.append(int(lo))
-                        his.append(int(hi))
-
-                    mask_bytes = packbits_py(mask)
-                    blocks.append(struct.pack(">BBBBBB", *los, *his) + mask_bytes)
-
-                    block_index += 1
-                    if block_index % 100 == 0 or block_index == total_blocks:
-                        progress = int((block_index / total_blocks) * 100)
-                        self.update_progressbar_safe(progress)
-                        time.sleep(0.001)
-
-            header = struct.pack(">BHHB", 4, w, h, block_size)
-            self.compressed_data = header + b''.join(blocks)
-
-            self.after(0, self.on_compress_lossy_done)
-        except Exception as e:
-            self.after(0, lambda: self.status.config(text=f"Compression failed: {e}"))
-
     # Finalizes lossy compression: updates UI and displays stats.
     def on_compress_lossy_done(self):
         self.compressed_size = len(self.compressed_data)
@@ -485,67 +459,27 @@ class ImageCompressorApp(tk.Tk):
         self.file_label.config(text="")
         self.show_compression_stats()
 
-    # Runs lossy decompression in a background thread and updates the result on completion.
-    def decompress_lossy_thread(self):
-        try:
-            img = self.decompress_lossy_progress(self.compressed_data)
-            self.decompressed_image = img
-            self.after(0, self.on_decompress_done)
-        except Exception as e:
-            self.after(0, lambda: self.status.config(text=f"Decompression failed: {e}"))
-
-    # Reconstructs the image from lossy compressed data using block-wise decoding.
-    def decompress_lossy_progress(self, data):
-        mode, w, h, block_size = struct.unpack(">BHHB", data[:6])
-        arr = np.zeros((h, w, 3), dtype=np.uint8)
-        blocks_y = (h + block_size - 1) // block_size
-        blocks_x = (w + block_size - 1) // block_size
-        idx = 6
-        total_blocks = blocks_y * blocks_x
-        block_index = 0
-
-        for by in range(blocks_y):
-            for bx in range(blocks_x):
-                y0, y1 = by * block_size, min((by + 1) * block_size, h)
-                x0, x1 = bx * block_size, min((bx + 1) * block_size, w)
-                block_pixels = (y1 - y0) * (x1 - x0)
-
-                los = list(data[idx:idx + 3])
-                his = list(data[idx + 3:idx + 6])
-
-                mask_bytes_len = (block_pixels + 7) // 8
-                mask_bytes = data[idx + 6:idx + 6 + mask_bytes_len]
-                mask = unpackbits_py(mask_bytes, block_pixels)
-
-                block = np.zeros((block_pixels, 3), dtype=np.uint8)
-                for ch in range(3):
-                    block[:, ch] = np.where(np.array(mask) == 1, his[ch], los[ch])
-
-                arr[y0:y1, x0:x1] = block.reshape((y1 - y0, x1 - x0, 3))
-                idx += 6 + mask_bytes_len
-
-                block_index += 1
-                if block_index % 100 == 0 or block_index == total_blocks:
-                    progress = int((block_index / total_blocks) * 100)
-                    self.update_progressbar_safe(progress)
-                    time.sleep(0.001)
-
-        return Image.fromarray(arr, "RGB")
-
-
     # ===================== DECOMPRESSION ENTRY AND UI UPDATE =====================
 
     # Starts the appropriate decompression process (lossless or lossy) in a background thread.
     def decompress_image(self):
+        if self.job_running():
+            return
         if self.compressed_data and self.image is None and self.decompressed_image is None:
             self.metrics.config(text="") 
-            mode = self.compressed_data[0]
-            self.status.config(text="Decompressing...")
-            self.show_progress()
-            if mode == 0:
-                threading.Thread(target=self.decompress_lossless_thread, daemon=True).start()
+            if self.prefetch_error is not None:
+                self.status.config(text=f"Decompression failed: {self.prefetch_error}")
+            elif self.prefetched_image is not None:
+                self.decompressed_image = self.prefetched_image
+                self.on_decompress_done()
             else:
-                threading.Thread(target=self.decompress_lossy_thread, daemon=True).start()
+                if self.prefetch_job is None:
+                    # The background decode was cancelled: start it again.
+                    self.start_prefetch(myimg_codec.read_container(self.compressed_data, verify=False))
+                self.status.config(text="Decompressing...")
+                self.show_progress()
+                self.decompress_requested = True
+                self.current_job = self.prefetch_job
         elif self.decompressed_image is not None:
             messagebox.showinfo("Already Decompressed", "This file has already been decompressed.\nPlease load a new .myimg file if needed.")
         elif self.image:
@@ -553,6 +487,44 @@ class ImageCompressorApp(tk.Tk):
         else:
             messagebox.showwarning("No Compressed Data", "No compressed image available to decompress.\nPlease load a .myimg file first.")
 
+    # Starts decoding a freshly loaded .myimg file in the background, so Decompress is instant once it finishes.
+    # The codec picks the decoder (lossless or lossy) from the file mode.
+    def start_prefetch(self, myimg_file):
+        self.prefetched_image = None
+        self.prefetch_error = None
+        self.decompress_requested = False
+        self.profile = self.new_profile()
+        self.prefetch_job = self.submit_job("Decompress", myimg_codec.decode, myimg_file, profile=self.profile,
+                                            on_done=self.on_prefetch_done)
+
+    # Stores the background decode result; finishes a pending Decompress request right away.
+    # Results from a file that has since been replaced or reset are discarded.
+    def on_prefetch_done(self, job):
+        if job is not self.prefetch_job:
+            return
+        self.jobs.clear_finished()
+        if job.state == myimg_jobs.CANCELLED:
+            self.prefetch_job = None
+            if self.decompress_requested:
+                self.decompress_requested = False
+                self.current_job = None
+                self.hide_progress()
+                self.status.config(text="Decompression cancelled.")
+            return
+        img, error = job.result, job.error
+        self.prefetched_image = img
+        self.prefetch_error = error
+        if not self.decompress_requested:
+            return
+        self.decompress_requested = False
+        self.current_job = None
+        if error is not None:
+            self.hide_progress()
+            self.status.config(text=f"Decompression failed: {error}")
+        else:
+            self.decompressed_image = img
+            self.on_decompress_done()
+
     # Finalizes decompression by updating the preview, status, and UI labels.
     def on_decompress_done(self):
         self.status.config(text="Image decompressed")
@@ -560,6 +532,8 @@ class ImageCompressorApp(tk.Tk):
         self.progress_label.config(text="100%")
         self.hide_progress()
         self.update_preview(self.decompressed_image)
+        if self.profile is not None:
+            self.metrics.config(text=self.format_profile())
         if hasattr(self, 'last_myimg_filename'):
             self.file_label.config(text=f"{self.last_myimg_filename} (Decompressed Image)")
         else:
@@ -570,63 +544,51 @@ class ImageCompressorApp(tk.Tk):
 
     # Converts the loaded image to grayscale.
     def convert_image_to_grayscale(self):
-        self.metrics.config(text="") 
-        if self.edit_applied:
-            messagebox.showwarning("Edit Blocked", "You have already applied an effect.\nPlease reset or reload the image to apply another.")
-            return
-        if self.image and self.compressed_data is None:
-            self.image = self.image.convert("L").convert("RGB")
-            self.update_preview(self.image)
-            self.status.config(text="Grayscale effect applied.")
-            self.edit_applied = True
-        elif self.compressed_data:
-            messagebox.showwarning("Compressed File Loaded", "Cannot apply effects to a compressed image.\nPlease load a regular image file.")
-        else:
-            messagebox.showwarning("No Image Loaded", "Please load an image before applying effects.")
+        self.apply_effect(myimg_effects.GRAYSCALE)
 
     # Inverts the colors of the loaded image (RGB → inverse RGB).
     def invert_image(self):
-        self.metrics.config(text="") 
-        if self.edit_applied:
-            messagebox.showwarning("Edit Blocked", "An effect has already been applied.\nPlease reset or reload the image to apply another.")
-            return
-        if self.image and self.compressed_data is None:
-            self.image = ImageOps.invert(self.image.convert("RGB"))
-            self.update_preview(self.image)
-            self.status.config(text="Invert effect applied.")
-            self.edit_applied = True
-        elif self.compressed_data:
-            messagebox.showwarning("Compressed File Loaded", "Cannot apply effects to a compressed image.\nPlease load a regular image file.")
-        else:
-            messagebox.showwarning("No Image Loaded", "Please load an image before applying effects.")
+        self.apply_effect(myimg_effects.INVERT)
 
     # Applies a sepia tone effect to the loaded image for a warm, vintage look.
     def apply_sepia(self):
+        self.apply_effect(myimg_effects.SEPIA)
+
+    # Adds an effect to the loaded image. Any number of effects can be chained. Effects are only
+    # recorded here and rendered on the preview-sized copy; the full-resolution image gets the
+    # whole chain in one pass when it is compressed.
+    def apply_effect(self, effect):
         self.metrics.config(text="") 
-        if self.edit_applied:
-            messagebox.showwarning("Edit Blocked", "An effect has already been applied.\nPlease reset or reload the image to apply another.")
-            return
-        if self.image and self.compressed_data is None:
-            img = self.image.convert("RGB")
-            arr = np.array(img)
-
-            tr = (arr[:, :, 0] * 0.393 + arr[:, :, 1] * 0.769 + arr[:, :, 2] * 0.189)
-            tg = (arr[:, :, 0] * 0.349 + arr[:, :, 1] * 0.686 + arr[:, :, 2] * 0.168)
-            tb = (arr[:, :, 0] * 0.272 + arr[:, :, 1] * 0.534 + arr[:, :, 2] * 0.131)
-
-            arr[:, :, 0] = np.clip(tr, 0, 255)
-            arr[:, :, 1] = np.clip(tg, 0, 255)
-            arr[:, :, 2] = np.clip(tb, 0, 255)
-
-            self.image = Image.fromarray(arr.astype(np.uint8))
-            self.update_preview(self.image)
-            self.status.config(text="Sepia effect applied.")
-            self.edit_applied = True
+        if self.image and self.compressed_data is None and self.decompressed_image is None:
+            self.effects.append(effect)
+            self.update_preview(myimg_effects.apply_effects(self.preview_image, self.effects))
+            self.status.config(text=f"{effect.name} effect applied ({self.describe_effects()}).")
         elif self.compressed_data:
             messagebox.showwarning("Compressed File Loaded", "Cannot apply effects to a compressed image.\nPlease load a regular image file.")
         else:
             messagebox.showwarning("No Image Loaded", "Please load an image before applying effects.")
 
+    # Removes the most recently applied effect.
+    def undo_effect(self):
+        self.metrics.config(text="") 
+        if not self.effects or self.compressed_data is not None:
+            messagebox.showinfo("Nothing to Undo", "No effect has been applied to the current image.")
+            return
+        effect = self.effects.pop()
+        self.update_preview(myimg_effects.apply_effects(self.preview_image, self.effects))
+        self.status.config(text=f"{effect.name} effect removed ({self.describe_effects()}).")
+
+    # Names of the applied effects in order, for the status line.
+    def describe_effects(self):
+        return " → ".join(e.name for e in self.effects) if self.effects else "no effects"
+
+    # Job body for compression: applies the pending effects to the full-resolution image, then
+    # runs encoder on the result.
+    def encode_edited(self, encoder, img, effects, progress=None, profile=None, **kwargs):
+        with stage(profile, "effects"):
+            img = myimg_effects.apply_effects(img, effects)
+        return encoder(img, progress=progress, profile=profile, **kwargs)
+
     
     # ===================== THEME SWITCHING =====================
 
@@ -634,6 +596,7 @@ class ImageCompressorApp(tk.Tk):
     def set_light_mode(self, event=None):
         self.configure(bg=self.light_bg)
         self.topbar.configure(bg=self.light_bg)
+        self.profile_check.configure(bg=self.light_bg, fg="#003366", activebackground=self.light_bg, selectcolor="white")
         self.title_label.configure(bg=self.light_bg, fg="#003366")
         self.file_label.configure(bg=self.light_bg)
         self.top_frame.configure(bg=self.light_bg)
@@ -650,6 +613,7 @@ class ImageCompressorApp(tk.Tk):
     def set_dark_mode(self, event=None):
         self.configure(bg=self.dark_bg)
         self.topbar.configure(bg=self.dark_bg)
+        self.profile_check.configure(bg=self.dark_bg, fg="#eaf6ff", activebackground=self.dark_bg, selectcolor="#444")
         self.title_label.configure(bg=self.dark_bg, fg="#eaf6ff")
         self.file_label.configure(bg=self.dark_bg, fg="#ff5555") 
         self.top_frame.configure(bg=self.dark_bg)
@@ -671,13 +635,15 @@ class ImageCompressorApp(tk.Tk):
         messagebox.showinfo("Help",
         "How to Use:\n\n"
         "▪ Load Image: Select an image file to compress.\n"
-        "▪ Edit Image: Apply effects like Grayscale, Invert, or Sepia to an original image.\n"
+        "▪ Edit Image: Apply and chain effects like Grayscale, Invert, or Sepia to an original image; Undo removes the last one.\n"
         "▪ Compress (Lossless): Apply LZW'84-based compression.\n"
         "▪ Compress (Lossy): Apply block-wise color approximation.\n"
         "▪ Save as .myimg: Save compressed data to a .myimg file.\n"
         "▪ Load .myimg: Load a previously saved .myimg file.\n"
         "▪ Decompress: Reconstruct the original image from .myimg.\n"
         "▪ Save as PNG: Export the decompressed image.\n"
+        "▪ Batch Jobs: Compress or decompress many files in the background.\n"
+        "▪ Cancel: Stop the running compression or decompression.\n"
         "▪ Reset: Clear loaded and compressed data.\n"
         "▪ Theme Toggle: Switch between light and dark themes.\n"
         "▪ Exit: Close the application."
@@ -688,7 +654,16 @@ class ImageCompressorApp(tk.Tk):
     # Prompts the user before exiting to prevent accidental data loss.
     def confirm_exit(self):
         if messagebox.askokcancel("Exit", "Are you sure you want to exit?\nAny unsaved data will be lost."):
-            self.destroy()
+            self.close()
+
+    # Cancels all jobs and closes the window (also used for the title bar's close button). The
+    # job pools' threads are not daemons, so without this a closed window would leave the
+    # process running until every queued job had finished.
+    def close(self):
+        self.closed = True
+        self.jobs.shutdown(cancel=True)
+        self.batch_jobs.shutdown(cancel=True)
+        self.destroy()
 
     # Prompts the user before resetting to prevent accidental data loss.
     def confirm_reset(self):
@@ -697,9 +672,16 @@ class ImageCompressorApp(tk.Tk):
     
     # Clears all loaded data and resets the interface to its initial state.
     def reset(self):
+        self.cancel_jobs()
         self.image = None
+        self.preview_image = None
+        self.effects = []
         self.compressed_data = None
         self.decompressed_image = None
+        self.prefetched_image = None
+        self.prefetch_error = None
+        self.decompress_requested = False
+        self.profile = None
         self.image_path = None
         self.compressed_size = 0
         self.preview.config(image="")
@@ -707,7 +689,6 @@ class ImageCompressorApp(tk.Tk):
         self.status.config(text="Reset completed.")
         self.metrics.config(text="")
         self.file_label.config(text="No file selected")
-        self.edit_applied = False
         self.compressed_saved = False
         self.progress["value"] = 0
         self.progress_label.config(text="")
@@ -742,9 +723,152 @@ class ImageCompressorApp(tk.Tk):
             )
 
             stats = f"{line1}\n\n{line2}" if line1 else line2
+            f = myimg_codec.read_container(self.compressed_data, verify=False)
+            if f.mode in myimg_codec.PALETTE_MODES:
+                palette = "quantized to 256 colors" if f.flags & myimg_codec.FLAG_QUANTIZED else "exact (no quantization)"
+                stats += f"\n{'Palette':<26}: {palette}"
+            if self.profile is not None:
+                stats += "\n\n" + self.format_profile()
             self.metrics.config(text=stats)
 
-    
+    # Returns a new StageProfile when "Profile stages" is ticked, otherwise None (no profiling).
+    def new_profile(self):
+        return StageProfile() if self.profile_var.get() else None
+
+    # Formats the per-stage timings of the last compression or decompression.
+    def format_profile(self):
+        lines = "\n".join(self.profile.format_lines())
+        return f"[Stage Timing]\n{lines}\n{'Total':<20}: {self.profile.total_seconds * 1000:>9.1f} ms"
+
+
+# ===================== BATCH JOB WINDOW =====================
+
+# Window that queues compress/decompress jobs over many files and lists their progress and
+# results. Jobs run on the app's batch pool, so the main window stays usable and closing this
+# window does not stop them; the list is refreshed by polling the job states.
+class BatchJobsWindow(tk.Toplevel):
+    POLL_MS = 200
+    COLUMNS = (("file", "File", 170), ("kind", "Job", 80), ("status", "Status", 75), ("progress", "Progress", 65), ("result", "Result", 330))
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.title("Batch Jobs")
+        self.geometry("760x400")
+        bg = app.cget("bg")
+        self.configure(bg=bg)
+        self.queue = app.batch_jobs
+        self.out_dir = None
+
+        controls = tk.Frame(self, bg=bg)
+        controls.pack(fill="x", padx=8, pady=8)
+        ttk.Button(controls, text="Add Images", command=self.add_compress_jobs).pack(side="left", padx=4)
+        self.mode_var = tk.StringVar(value="lossy")
+        ttk.Combobox(controls, textvariable=self.mode_var, values=COMPRESS_MODES, state="readonly", width=14).pack(side="left", padx=4)
+        ttk.Button(controls, text="Add .myimg Files", command=self.add_decompress_jobs).pack(side="left", padx=4)
+        ttk.Button(controls, text="Output Folder", command=self.choose_out_dir).pack(side="left", padx=4)
+        self.out_label = tk.Label(controls, text="(next to each input)", font=("Segoe UI", 9, "italic"), bg=bg, fg="#888")
+        self.out_label.pack(side="left", padx=4)
+        self.overwrite_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(controls, text="Overwrite", variable=self.overwrite_var).pack(side="left", padx=4)
+
+        table = tk.Frame(self, bg=bg)
+        table.pack(fill="both", expand=True, padx=8)
+        self.tree = ttk.Treeview(table, columns=[c[0] for c in self.COLUMNS], show="headings", selectmode="extended")
+        for key, title, width in self.COLUMNS:
+            self.tree.heading(key, text=title)
+            self.tree.column(key, width=width, anchor="w")
+        scroll = ttk.Scrollbar(table, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scroll.set)
+        self.tree.pack(side="left", fill="both", expand=True)
+        scroll.pack(side="right", fill="y")
+
+        actions = tk.Frame(self, bg=bg)
+        actions.pack(fill="x", padx=8, pady=8)
+        ttk.Button(actions, text="Cancel Selected", command=self.cancel_selected).pack(side="left", padx=4)
+        ttk.Button(actions, text="Cancel All", command=self.queue.cancel_all).pack(side="left", padx=4)
+        ttk.Button(actions, text="Clear Finished", command=self.queue.clear_finished).pack(side="left", padx=4)
+        self.summary = tk.Label(actions, text="", font=("Segoe UI", 9), bg=bg, fg="#888")
+        self.summary.pack(side="right", padx=4)
+
+        self.shown = {}
+        self.poll_id = None
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        self.poll()
+
+    # Queues one compression job per selected image.
+    def add_compress_jobs(self):
+        filetypes = [('Image Files', '*.png *.jpg *.jpeg *.bmp *.webp *.gif *.tif *.tiff *.ico *.jp2 *.pbm *.pgm *.ppm')]
+        paths = filedialog.askopenfilenames(parent=self, filetypes=filetypes)
+        self.submit_all(paths, lambda path: self.queue.submit_compress(path, self.mode_var.get(), self.out_dir,
+                                                                          overwrite=self.overwrite_var.get()))
+
+    # Queues one decompression job per selected .myimg file.
+    def add_decompress_jobs(self):
+        paths = filedialog.askopenfilenames(parent=self, filetypes=[('My Image Format', '*.myimg')])
+        self.submit_all(paths, lambda path: self.queue.submit_decompress(path, self.out_dir, overwrite=self.overwrite_var.get()))
+
+    # Queues submit(path) for each path; files whose output already exists (unless Overwrite is
+    # ticked) or is written by another queued job are skipped and listed.
+    def submit_all(self, paths, submit):
+        skipped = []
+        for path in paths:
+            try:
+                submit(path)
+            except ValueError as e:
+                skipped.append(str(e))
+        if skipped:
+            messagebox.showwarning("Jobs Skipped", "These files were not queued:\n" + "\n".join(skipped), parent=self)
+
+    def choose_out_dir(self):
+        path = filedialog.askdirectory(parent=self)
+        if path:
+            self.out_dir = path
+            self.out_label.config(text=path)
+
+    def cancel_selected(self):
+        selected = set(self.tree.selection())
+        for job in self.queue.jobs:
+            if str(job.id) in selected:
+                self.queue.cancel(job)
+
+    # Short result text of a job: output size and time, or the error.
+    def describe(self, job):
+        if job.state == myimg_jobs.FAILED:
+            return f"Error: {job.error}"
+        if job.state != myimg_jobs.DONE:
+            return ""
+        r = job.result
+        if job.kind == "compress":
+            reduction = (1 - r["output_size"] / r["raw_size"]) * 100 if r["raw_size"] else 0
+            return f"{fmt_size(r['output_size'])} ({reduction:.1f}% smaller than raw) in {r['seconds']:.2f}s"
+        return f"{os.path.basename(r['output'])} ({fmt_size(r['output_size'])}) in {r['seconds']:.2f}s"
+
+    # Refreshes the rows whose job changed, drops rows of cleared jobs and reschedules itself.
+    def poll(self):
+        current = set()
+        for job in self.queue.jobs:
+            iid = str(job.id)
+            current.add(iid)
+            values = (job.name, job.kind, job.state, f"{job.progress}%", self.describe(job))
+            if iid not in self.shown:
+                self.tree.insert("", "end", iid=iid, values=values)
+            elif self.shown[iid] != values:
+                self.tree.item(iid, values=values)
+            self.shown[iid] = values
+        for iid in set(self.shown) - current:
+            self.tree.delete(iid)
+            del self.shown[iid]
+        counts = self.queue.counts()
+        self.summary.config(text=", ".join(f"{n} {state}" for state, n in counts.items() if n))
+        self.poll_id = self.after(self.POLL_MS, self.poll)
+
+    # Closes the window; queued and running jobs continue.
+    def close(self):
+        if self.poll_id is not None:
+            self.after_cancel(self.poll_id)
+        self.destroy()
+
+
 # ================== ENTRY POINT ==================
 
 if __name__ == "__main__":
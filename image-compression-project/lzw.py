@@ -0,0 +1,235 @@
+import numpy as np
+
+# LZW'84 core used by the lossless .myimg modes: the compression engine over a
+# byte string and the code (de)serializers for the on-disk code streams.
+
+LZW_MIN_WIDTH = 9
+LZW_MAX_WIDTH = 12
+LZW_MAX_DICT_SIZE = 1 << LZW_MAX_WIDTH
+
+# Dictionary-reset support (lossless mode 2): code 256 is CLEAR and new entries start at 257.
+LZW_CLEAR_CODE = 256
+LZW_FIRST_CODE_CLEAR = 257
+# A full dictionary is always followed by CLEAR, so every segment has the same number of codes:
+# 4096 - 257 codes that add an entry, the one that finds the table full, then CLEAR itself.
+LZW_CLEAR_PERIOD = LZW_MAX_DICT_SIZE - LZW_FIRST_CODE_CLEAR + 2
+
+# Input bytes (encoder) and codes (decoder) handled between two progress reports.
+ENCODE_CHUNK_BYTES = 1 << 16
+DECODE_CHUNK_CODES = 1 << 15
+
+# Codes fed to the decoder per step when decoding as a stream. A code expands to at most 4096
+# bytes, so one step never produces more than 1 MiB of output.
+STREAM_DECODE_CODES = 1 << 8
+
+# Number of codes handled per chunk by the bulk bit packer and by the code slice readers
+# (bounds temporary memory).
+PACK_CHUNK_CODES = 1 << 20
+UNPACK_CHUNK_CODES = 1 << 14
+
+# ===================== LZW ENGINE =====================
+
+# Compresses a byte string into a list of LZW codes.
+# The dictionary is keyed on (prefix_code << 8) | next_byte integers, so the hot loop never builds
+# byte strings. Without clear the dictionary freezes at 4096 entries (modes 0/1, bit-exact with the
+# original encoder); with clear a CLEAR code is emitted and the dictionary restarts whenever it fills,
+# which keeps adapting on large images whose content changes.
+def lzw_encode(data, clear=False, progress=None):
+    codes = []
+    total = len(data)
+    if total == 0:
+        return codes
+    append = codes.append
+    first_code = LZW_FIRST_CODE_CLEAR if clear else 256
+    table = {}
+    lookup = table.get
+    next_code = first_code
+    prefix = data[0]
+
+    for start in range(1, total, ENCODE_CHUNK_BYTES):
+        for c in data[start:start + ENCODE_CHUNK_BYTES]:
+            key = (prefix << 8) | c
+            code = lookup(key)
+            if code is not None:
+                prefix = code
+                continue
+            append(prefix)
+            if next_code < LZW_MAX_DICT_SIZE:
+                table[key] = next_code
+                next_code += 1
+            elif clear:
+                append(LZW_CLEAR_CODE)
+                table.clear()
+                next_code = first_code
+            prefix = c
+        if progress is not None:
+            progress(int((min(start + ENCODE_CHUNK_BYTES, total) / total) * 100))
+    append(prefix)
+    return codes
+
+# Incremental LZW decoder: feed() expands the next codes of a stream, keeping the dictionary and
+# the previous string between calls, so a code stream can be decoded in slices of any size.
+# The dictionary is a flat list indexed by code (at most 4096 entries, so its memory is bounded
+# no matter how large the image is), and each code costs one list lookup plus one append to the
+# output buffer. Decoding stops with ValueError as soon as the output would run past out_size.
+# With clear, code 256 resets the dictionary and the next code starts a fresh string.
+class LZWDecoder:
+    def __init__(self, out_size, clear=False):
+        self.out_size = out_size
+        self.produced = 0
+        self._first_code = LZW_FIRST_CODE_CLEAR if clear else 256
+        self._clear_code = LZW_CLEAR_CODE if clear else -1
+        self._table = [bytes([i]) for i in range(256)] + [b""] * (LZW_MAX_DICT_SIZE - 256)
+        self._prev = None
+        self._dict_size = self._first_code
+
+    # Appends the expansion of codes (a list or integer array) to out, a new bytearray by
+    # default, and returns out.
+    def feed(self, codes, out=None):
+        if out is None:
+            out = bytearray()
+        if isinstance(codes, np.ndarray):
+            codes = codes.tolist()
+        if not codes:
+            return out
+        start_len = len(out)
+        table = self._table
+        first_code = self._first_code
+        clear_code = self._clear_code
+        max_size = LZW_MAX_DICT_SIZE
+        prev = self._prev
+        dict_size = self._dict_size
+        if prev is None:
+            if not 0 <= codes[0] < 256:
+                raise ValueError("Invalid LZW code: %d" % codes[0])
+            prev = table[codes[0]]
+            out += prev
+            codes = codes[1:]
+
+        for k in codes:
+            if k == clear_code:
+                # The code after CLEAR has no previous string; starting one slot early makes it
+                # "add" a throwaway entry at the CLEAR code's own slot, which is never looked up.
+                dict_size = first_code - 1
+                continue
+            if k < dict_size:
+                cur = table[k]
+            elif k == dict_size:
+                # KwKwK: the new string is the previous one plus its own first byte.
+                cur = prev + prev[:1]
+            else:
+                raise ValueError("Invalid LZW code: %d" % k)
+            out += cur
+            if dict_size < max_size:
+                table[dict_size] = prev + cur[:1]
+                dict_size += 1
+            prev = cur
+
+        self._prev = prev
+        self._dict_size = dict_size
+        self.produced += len(out) - start_len
+        if self.produced > self.out_size:
+            raise ValueError("LZW data decodes past the end of the image")
+        return out
+
+    # Checks that the stream fed so far decoded to exactly out_size bytes.
+    def finish(self):
+        if self.produced != self.out_size:
+            raise ValueError(f"LZW data decodes to {self.produced} bytes, expected {self.out_size}")
+
+# Expands a sequence of LZW codes (a list or integer array) back into exactly out_size bytes.
+def lzw_decode(codes, out_size, clear=False, progress=None):
+    decoder = LZWDecoder(out_size, clear)
+    out = bytearray()
+    steps = len(codes)
+    for chunk_start in range(0, steps, DECODE_CHUNK_CODES):
+        decoder.feed(codes[chunk_start:chunk_start + DECODE_CHUNK_CODES], out)
+        if progress is not None:
+            progress(int((min(chunk_start + DECODE_CHUNK_CODES, steps) / steps) * 100))
+    decoder.finish()
+    return out
+
+# ===================== CODE STREAM SERIALIZATION =====================
+
+# Packs codes as fixed 16-bit big-endian words (original mode-0 layout).
+def pack_codes_fixed16(codes):
+    return np.asarray(codes, dtype='>u2').tobytes()
+
+# Reads fixed 16-bit big-endian codes.
+def unpack_codes_fixed16(payload):
+    return np.frombuffer(payload, dtype='>u2', count=len(payload) // 2).astype(np.uint16)
+
+# Reads fixed 16-bit big-endian codes as a sequence of uint16 arrays of up to chunk_codes codes.
+def iter_unpack_codes_fixed16(payload, chunk_codes=UNPACK_CHUNK_CODES):
+    codes = np.frombuffer(payload, dtype='>u2', count=len(payload) // 2)
+    for start in range(0, len(codes), chunk_codes):
+        yield codes[start:start + chunk_codes].astype(np.uint16)
+
+# Returns the bit width of each code index for the growing-width layout (9 -> 12 bits).
+# When code i is written the decoder knows first_code + i - 1 entries and may also see the next
+# free code, so code i is always < first_code + i; the width follows from the index alone.
+# With period, the index restarts after every CLEAR (see LZW_CLEAR_PERIOD).
+def variable_code_widths(count, start=0, first_code=256, period=None):
+    index = np.arange(start, start + count, dtype=np.int64)
+    if period:
+        index %= period
+    limit = np.minimum(index + first_code, LZW_MAX_DICT_SIZE) - 1
+    widths = np.full(count, LZW_MIN_WIDTH, dtype=np.int64)
+    for width in range(LZW_MIN_WIDTH + 1, LZW_MAX_WIDTH + 1):
+        widths[limit >= (1 << (width - 1))] = width
+    return widths
+
+# Width schedule for a variable-width stream with or without CLEAR codes.
+def _code_widths(count, start, clear):
+    if clear:
+        return variable_code_widths(count, start, LZW_FIRST_CODE_CLEAR, LZW_CLEAR_PERIOD)
+    return variable_code_widths(count, start)
+
+# Packs codes MSB-first into a bit stream whose code widths grow from 9 to 12 bits (TIFF-style).
+def pack_codes_variable(codes, clear=False):
+    codes = np.asarray(codes, dtype=np.uint16)
+    shifts = np.arange(LZW_MAX_WIDTH - 1, -1, -1, dtype=np.uint16)
+    columns = np.arange(LZW_MAX_WIDTH)
+    bit_chunks = []
+    for start in range(0, len(codes), PACK_CHUNK_CODES):
+        chunk = codes[start:start + PACK_CHUNK_CODES]
+        widths = _code_widths(len(chunk), start, clear)
+        bits = ((chunk[:, None] >> shifts) & 1).astype(np.uint8)
+        keep = columns[None, :] >= (LZW_MAX_WIDTH - widths)[:, None]
+        bit_chunks.append(bits[keep])
+    if not bit_chunks:
+        return b""
+    return np.packbits(np.concatenate(bit_chunks)).tobytes()
+
+# Reads a growing-width MSB-first code stream as a sequence of uint16 arrays of up to chunk_codes
+# codes. The code count is implied by the payload length, since the final padding (< 8 bits) is
+# always shorter than the narrowest code. The width of a code follows from its index, so each
+# slice is read on its own from the index and bit position where the previous one ended.
+def iter_unpack_codes_variable(payload, clear=False, chunk_codes=UNPACK_CHUNK_CODES):
+    data = np.frombuffer(payload, dtype=np.uint8)
+    total_bits = len(data) * 8
+    index, bit = 0, 0
+    while total_bits - bit >= LZW_MIN_WIDTH:
+        widths = _code_widths(chunk_codes, index, clear)
+        ends = bit + np.cumsum(widths)
+        count = int(np.searchsorted(ends, total_bits, side="right"))
+        if count == 0:
+            break
+        widths, starts = widths[:count], ends[:count] - widths[:count]
+
+        # Any code of <= 12 bits lies inside the 24-bit window that starts at its first byte.
+        first = starts >> 3
+        base = int(first[0])
+        window_bytes = data[base:int(first[-1]) + 3]
+        buf = np.zeros(int(first[-1]) + 3 - base, dtype=np.int32)
+        buf[:len(window_bytes)] = window_bytes
+        first -= base
+        window = (buf[first] << 16) | (buf[first + 1] << 8) | buf[first + 2]
+        yield ((window >> (24 - (starts & 7) - widths)) & ((1 << widths) - 1)).astype(np.uint16)
+        index += count
+        bit = int(ends[count - 1])
+
+# Reads a growing-width MSB-first code stream into one uint16 array.
+def unpack_codes_variable(payload, clear=False):
+    chunks = list(iter_unpack_codes_variable(payload, clear))
+    return np.concatenate(chunks) if chunks else np.empty(0, dtype=np.uint16)
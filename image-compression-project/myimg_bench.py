@@ -0,0 +1,249 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+import PIL
+from PIL import Image
+import numpy as np
+import myimg_codec
+from myimg_codec import fmt_size
+from myimg_cli import COMPRESS_MODES, IMAGE_EXTENSIONS, collect_inputs
+
+# Benchmark harness for the .myimg codecs. Encodes and decodes a corpus of synthetic images
+# (gradients, noise, flat screenshots, photo-like scenes) at several resolutions, plus any real
+# images given on the command line, and reports throughput, peak memory, compression ratio and
+# PSNR. Results can be written as JSON and compared against an earlier run.
+#
+#   python myimg_bench.py --sizes 1,12,50 --json bench.json
+#   python myimg_bench.py photos/ --modes lossy --baseline bench.json
+
+SYNTHETIC_KINDS = ("gradient", "noise", "screenshot", "photo")
+DEFAULT_SIZES = (0.25, 1.0, 4.0)
+DEFAULT_MODES = ("lossless", "lossy")
+BENCH_SCHEMA = 1
+
+# ===================== CORPUS =====================
+
+# Returns (width, height) of a 4:3 image with about megapixels million pixels.
+def size_for_megapixels(megapixels):
+    w = max(1, int(round((megapixels * 1e6 * 4 / 3) ** 0.5)))
+    return w, max(1, int(round(megapixels * 1e6 / w)))
+
+# Smooth diagonal RGB gradient: the best case for both codecs.
+def make_gradient(w, h, rng):
+    x = np.linspace(0, 255, w, dtype=np.float32)[None, :]
+    y = np.linspace(0, 255, h, dtype=np.float32)[:, None]
+    arr = np.empty((h, w, 3), dtype=np.uint8)
+    arr[..., 0] = x
+    arr[..., 1] = y
+    arr[..., 2] = (x + y) / 2
+    return Image.fromarray(arr)
+
+# Uniform RGB noise: the worst case, nothing to compress.
+def make_noise(w, h, rng):
+    return Image.fromarray(rng.integers(0, 256, (h, w, 3), dtype=np.uint8))
+
+# Screenshot-like content: flat panels from a small palette with rows of thin "text" strokes.
+def make_screenshot(w, h, rng):
+    colors = rng.integers(0, 256, (8, 3), dtype=np.uint8)
+    cell = 64
+    panels = rng.integers(0, len(colors), ((h + cell - 1) // cell, (w + cell - 1) // cell))
+    arr = colors[np.repeat(np.repeat(panels, cell, axis=0), cell, axis=1)[:h, :w]]
+    strokes = (np.arange(h) % 16 < 2)[:, None] & (rng.random(w) < 0.6)[None, :]
+    arr[strokes] = colors[0]
+    return Image.fromarray(arr)
+
+# Photo-like content: smooth low-frequency structure upscaled with bicubic filtering, plus sensor noise.
+def make_photo(w, h, rng):
+    base = rng.integers(0, 256, (max(2, h // 32), max(2, w // 32), 3), dtype=np.uint8)
+    arr = np.asarray(Image.fromarray(base).resize((w, h), Image.BICUBIC)).astype(np.int16)
+    arr += rng.integers(-4, 5, arr.shape, dtype=np.int16)
+    return Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8))
+
+SYNTHETIC_MAKERS = {"gradient": make_gradient, "noise": make_noise, "screenshot": make_screenshot, "photo": make_photo}
+
+# Yields (name, source, loader) for every corpus entry. Images are created lazily so that only
+# one large image is alive at a time.
+def iter_corpus(kinds, sizes, image_paths, seed=0):
+    for megapixels in sizes:
+        w, h = size_for_megapixels(megapixels)
+        for kind in kinds:
+            rng = np.random.default_rng(seed)
+            yield f"{kind}-{w}x{h}", "synthetic", lambda kind=kind, w=w, h=h, rng=rng: SYNTHETIC_MAKERS[kind](w, h, rng)
+    for path in image_paths:
+        yield os.path.basename(path), path, lambda path=path: _load_rgb(path)
+
+# Loads an image file fully into memory as RGB.
+def _load_rgb(path):
+    with Image.open(path) as img:
+        return img.convert("RGB")
+
+
+# ===================== MEASUREMENT =====================
+
+# Peak signal-to-noise ratio in dB between two RGB images; None when they are identical.
+def psnr(original, decoded):
+    a = np.asarray(original.convert("RGB"), dtype=np.float64)
+    b = np.asarray(decoded.convert("RGB"), dtype=np.float64)
+    mse = np.mean((a - b) ** 2)
+    if mse == 0:
+        return None
+    return float(10 * np.log10(255.0 ** 2 / mse))
+
+# Runs func repeat times and returns (last result, best wall time in seconds).
+def _timed(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+# Runs func once under tracemalloc and returns the peak traced allocation in bytes (numpy buffers
+# included). Kept separate from the timed runs because tracing slows the Python loops down a lot.
+def _peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+# Benchmarks one image in one mode and returns a flat result record.
+def bench_case(name, source, img, mode, block_size, quality, workers, repeat, measure_memory):
+    w, h = img.size
+    raw_size = w * h * 3
+    encode = lambda: myimg_codec.encode(img, mode=mode, block_size=block_size, quality=quality, workers=workers)
+    data, encode_seconds = _timed(encode, repeat)
+    decode = lambda: myimg_codec.decode(data, workers=workers)
+    decoded, decode_seconds = _timed(decode, repeat)
+    psnr_db = psnr(img, decoded)
+    mb = raw_size / (1024 * 1024)
+    return {
+        "image": name,
+        "source": source,
+        "mode": mode,
+        "width": w,
+        "height": h,
+        "raw_size": raw_size,
+        "output_size": len(data),
+        "ratio": raw_size / len(data) if data else None,
+        "bits_per_pixel": len(data) * 8 / (w * h),
+        "encode_seconds": encode_seconds,
+        "decode_seconds": decode_seconds,
+        "encode_mb_s": mb / max(encode_seconds, 1e-9),
+        "decode_mb_s": mb / max(decode_seconds, 1e-9),
+        "encode_peak_bytes": _peak_memory(encode) if measure_memory else None,
+        "decode_peak_bytes": _peak_memory(decode) if measure_memory else None,
+        "psnr": psnr_db,
+        "exact": psnr_db is None,
+    }
+
+
+# ===================== REPORTING =====================
+
+# Formats one result record as a single report line.
+def format_result(r):
+    quality = "exact" if r["exact"] else f"{r['psnr']:.2f} dB"
+    memory = ""
+    if r["encode_peak_bytes"] is not None:
+        memory = f", peak {fmt_size(r['encode_peak_bytes'])} / {fmt_size(r['decode_peak_bytes'])}"
+    return (f"{r['image']:<26} {r['mode']:<18} {fmt_size(r['output_size']):>10} "
+            f"ratio {r['ratio']:6.2f}  enc {r['encode_mb_s']:7.2f} MB/s  dec {r['decode_mb_s']:7.2f} MB/s  "
+            f"{quality}{memory}")
+
+# Formats per-case changes against a baseline run (matched on image and mode).
+def format_comparison(results, baseline):
+    previous = {(r["image"], r["mode"]): r for r in baseline.get("results", [])}
+    lines = ["[Comparison with baseline]"]
+    for r in results:
+        old = previous.get((r["image"], r["mode"]))
+        if old is None:
+            continue
+        change = lambda key: (r[key] / old[key] - 1) * 100 if old[key] else 0.0
+        lines.append(f"{r['image']:<26} {r['mode']:<18} size {change('output_size'):+7.2f}%  "
+                     f"enc {change('encode_mb_s'):+7.2f}%  dec {change('decode_mb_s'):+7.2f}%")
+    if len(lines) == 1:
+        lines.append("no matching cases")
+    return "\n".join(lines)
+
+# Environment details stored next to the results, so runs from different machines can be told apart.
+def environment():
+    return {"python": platform.python_version(), "numpy": np.__version__, "pillow": PIL.__version__,
+            "platform": platform.platform(), "cpu_count": os.cpu_count()}
+
+
+# ===================== ENTRY POINT =====================
+
+# Parses a comma-separated list of megapixel sizes.
+def _parse_sizes(text):
+    return tuple(float(s) for s in text.split(",") if s.strip())
+
+# Builds the argument parser for the benchmark.
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the .myimg codecs over a corpus of images.")
+    parser.add_argument("images", nargs="*", help="real images to add to the corpus (files, directories or globs)")
+    parser.add_argument("-s", "--sizes", type=_parse_sizes, default=DEFAULT_SIZES,
+                        help="synthetic image sizes in megapixels, comma-separated (default: 0.25,1,4; e.g. 1,12,50)")
+    parser.add_argument("-k", "--kinds", default=",".join(SYNTHETIC_KINDS),
+                        help="synthetic kinds to generate, comma-separated (empty for none)")
+    parser.add_argument("-m", "--modes", default=",".join(DEFAULT_MODES),
+                        help="codec modes, comma-separated: lossless, lossless-parallel, lossless-rgb, lossy, lossy-entropy, lossy-ycbcr, lossy-dedup, lossy-quadtree")
+    parser.add_argument("-b", "--block-size", type=int, default=myimg_codec.LOSSY_BLOCK_SIZE, help="lossy block size")
+    parser.add_argument("-q", "--quality", type=int, default=myimg_codec.QUADTREE_QUALITY, help="lossy-quadtree quality, 0-100")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="workers for lossless-parallel (default: all cores)")
+    parser.add_argument("-n", "--repeat", type=int, default=1, help="timed runs per case; the best is reported")
+    parser.add_argument("-r", "--recursive", action="store_true", help="descend into subdirectories of image inputs")
+    parser.add_argument("--no-memory", action="store_true", help="skip the (slow) tracemalloc peak-memory runs")
+    parser.add_argument("--json", help="write results as JSON to this path ('-' for stdout)")
+    parser.add_argument("--baseline", help="earlier JSON results to compare against")
+    return parser
+
+# Parses the command line, runs the benchmark and returns the process exit code.
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    kinds = [k for k in args.kinds.split(",") if k]
+    unknown = [k for k in kinds if k not in SYNTHETIC_MAKERS]
+    if unknown:
+        print(f"Unknown synthetic kind: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    modes = [m for m in args.modes.split(",") if m]
+    unknown = [m for m in modes if m not in COMPRESS_MODES + ("lossless-parallel",)]
+    if unknown:
+        print(f"Unknown codec mode: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    image_paths = collect_inputs(args.images, IMAGE_EXTENSIONS, args.recursive)
+    # With --json - the report goes to stderr so stdout stays valid JSON.
+    report = sys.stderr if args.json == "-" else sys.stdout
+
+    results = []
+    for name, source, load in iter_corpus(kinds, args.sizes, image_paths):
+        img = load()
+        for mode in modes:
+            r = bench_case(name, source, img, mode, args.block_size, args.quality, args.workers,
+                           max(1, args.repeat), not args.no_memory)
+            results.append(r)
+            print(format_result(r), file=report, flush=True)
+        del img
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            print("\n" + format_comparison(results, json.load(f)), file=report)
+    if args.json:
+        document = {"schema": BENCH_SCHEMA, "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "environment": environment(), "results": results}
+        text = json.dumps(document, indent=2)
+        if args.json == "-":
+            print(text)
+        else:
+            with open(args.json, "w") as f:
+                f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+import os
+import sys
+import glob
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from PIL import Image
+import myimg_codec
+from myimg_codec import fmt_size
+from myimg_profile import StageProfile, format_stages
+
+# Batch command-line front end for the .myimg codecs. Compresses (or decompresses) whole
+# directories and globs in a pool of worker processes and prints per-file and aggregate
+# throughput and size statistics. Never imports tkinter, so it runs on headless machines.
+#
+#   python myimg_cli.py compress photos/ "scans/**/*.png" --mode lossy -o out/
+#   python myimg_cli.py decompress out/ -o png/
+
+# Mode names accepted by myimg_codec.encode for whole files (lossless-parallel is the GUI's strip mode).
+COMPRESS_MODES = ("lossless", "lossless-rgb", "lossy", "lossy-entropy", "lossy-ycbcr", "lossy-dedup", "lossy-quadtree")
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp', '.gif', '.tif', '.tiff', '.ico', '.jp2', '.pbm', '.pgm', '.ppm')
+
+# ===================== INPUT DISCOVERY =====================
+
+# Expands directories, globs and plain paths into a sorted, de-duplicated list of files.
+def collect_inputs(patterns, extensions, recursive=False):
+    found = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            walker = os.walk(pattern) if recursive else [(pattern, [], os.listdir(pattern))]
+            for root, _, names in walker:
+                found.extend(os.path.join(root, n) for n in names if n.lower().endswith(extensions))
+        elif glob.has_magic(pattern):
+            found.extend(p for p in glob.glob(pattern, recursive=True) if os.path.isfile(p))
+        else:
+            found.append(pattern)
+    return sorted(set(found))
+
+# Returns the output path for an input file: same stem, new extension, in out_dir if given.
+def output_path(path, extension, out_dir=None):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(out_dir or os.path.dirname(path), stem + extension)
+
+# Returns {output path: [input paths]} for the outputs that more than one input would write,
+# e.g. x/img.png and y/img.jpg both going to out/img.myimg.
+def duplicate_outputs(pairs):
+    inputs_by_output = {}
+    for path, out_path in pairs:
+        inputs_by_output.setdefault(os.path.normcase(os.path.abspath(out_path)), []).append(path)
+    return {out: paths for out, paths in inputs_by_output.items() if len(paths) > 1}
+
+
+# ===================== WORKERS =====================
+
+# Worker: compresses one image file to .myimg and returns its statistics. "quantized" tells whether
+# a palette mode had to reduce the colors to 256 (None for the other modes). With profile,
+# the per-stage codec timings are included under "stages". progress is passed to the codec.
+def compress_file(path, out_path, mode, block_size, quality=myimg_codec.QUADTREE_QUALITY, profile=False, progress=None):
+    start = time.perf_counter()
+    stages = StageProfile() if profile else None
+    with Image.open(path) as img:
+        data = myimg_codec.encode(img, mode=mode, block_size=block_size, quality=quality, progress=progress, profile=stages)
+        w, h = img.size
+    with open(out_path, "wb") as f:
+        f.write(data)
+    header = myimg_codec.read_container(data, verify=False)
+    quantized = bool(header.flags & myimg_codec.FLAG_QUANTIZED) if header.mode in myimg_codec.PALETTE_MODES else None
+    return {"input": path, "output": out_path, "input_size": os.path.getsize(path),
+            "raw_size": w * h * 3, "output_size": len(data), "seconds": time.perf_counter() - start,
+            "quantized": quantized, "stages": stages.as_dicts() if stages else None}
+
+# Worker: decompresses one .myimg file to PNG and returns its statistics. With band_pixels the
+# file is memory-mapped and decoded band by band straight into the output (PNG, or raw RGB for
+# other extensions), so neither the file nor the image is ever fully in memory; stage profiles
+# are not collected then. progress is passed to the codec.
+def decompress_file(path, out_path, profile=False, band_pixels=None, progress=None):
+    start = time.perf_counter()
+    if band_pixels:
+        with myimg_codec.map_file(path) as mm:
+            w, h = myimg_codec.decode_to_file(mm, out_path, band_pixels, progress)
+        return {"input": path, "output": out_path, "input_size": os.path.getsize(path),
+                "raw_size": w * h * 3, "output_size": os.path.getsize(out_path), "seconds": time.perf_counter() - start,
+                "stages": None}
+    stages = StageProfile() if profile else None
+    with open(path, "rb") as f:
+        data = f.read()
+    img = myimg_codec.decode(data, workers=1, progress=progress, profile=stages)
+    img.save(out_path)
+    w, h = img.size
+    return {"input": path, "output": out_path, "input_size": len(data),
+            "raw_size": w * h * 3, "output_size": os.path.getsize(out_path), "seconds": time.perf_counter() - start,
+            "stages": stages.as_dicts() if stages else None}
+
+# Runs the jobs (callable, args) in a process pool (inline for one worker), yielding
+# (args, result, error) as each job finishes.
+def run_jobs(func, jobs, workers):
+    if workers <= 1:
+        for args in jobs:
+            try:
+                yield args, func(*args), None
+            except Exception as e:
+                yield args, None, e
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(func, *args): args for args in jobs}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+
+
+# ===================== REPORTING =====================
+
+# Formats one file's statistics like show_compression_stats: sizes, reductions and throughput.
+def format_file_stats(stats, compressing):
+    name = os.path.basename(stats["input"])
+    mb_per_s = stats["raw_size"] / (1024 * 1024) / max(stats["seconds"], 1e-9)
+    if compressing:
+        ratio_raw = (1 - stats["output_size"] / stats["raw_size"]) * 100 if stats["raw_size"] else 0
+        ratio_file = (1 - stats["output_size"] / stats["input_size"]) * 100 if stats["input_size"] else 0
+        palette = {True: ", palette quantized", False: ", exact palette", None: ""}[stats["quantized"]]
+        return (f"{name}: {fmt_size(stats['input_size'])} -> {fmt_size(stats['output_size'])} "
+                f"(raw RGB {fmt_size(stats['raw_size'])}, {ratio_raw:.2f}% smaller than raw, "
+                f"{ratio_file:.2f}% vs original file{palette}) in {stats['seconds']:.2f}s, {mb_per_s:.2f} MB/s")
+    return (f"{name}: {fmt_size(stats['input_size'])} -> {os.path.basename(stats['output'])} "
+            f"({fmt_size(stats['output_size'])}) in {stats['seconds']:.2f}s, {mb_per_s:.2f} MB/s")
+
+# Formats aggregate statistics over all finished files.
+def format_summary(results, failures, wall_seconds, compressing):
+    total_in = sum(r["input_size"] for r in results)
+    total_out = sum(r["output_size"] for r in results)
+    total_raw = sum(r["raw_size"] for r in results)
+    mb_per_s = total_raw / (1024 * 1024) / max(wall_seconds, 1e-9)
+    lines = [
+        "[Summary]",
+        f"{'Files':<20}: {len(results)} ok, {failures} failed",
+        f"{'Input Size':<20}: {fmt_size(total_in)}",
+        f"{'Output Size':<20}: {fmt_size(total_out)}",
+        f"{'Raw RGB Size':<20}: {fmt_size(total_raw)}",
+    ]
+    if compressing and total_raw and total_in:
+        lines.append(f"{'Reduction vs Raw':<20}: {(1 - total_out / total_raw) * 100:.2f}%")
+        lines.append(f"{'Reduction vs Files':<20}: {(1 - total_out / total_in) * 100:.2f}%")
+    lines.append(f"{'Wall Time':<20}: {wall_seconds:.2f}s ({mb_per_s:.2f} MB/s of raw RGB)")
+    return "\n".join(lines)
+
+
+# ===================== ENTRY POINT =====================
+
+# Builds the argument parser for the compress/decompress subcommands.
+def build_parser():
+    parser = argparse.ArgumentParser(description="Batch .myimg compression and decompression.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("compress", "compress images to .myimg"), ("decompress", "decode .myimg files to PNG")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("inputs", nargs="+", help="files, directories or glob patterns")
+        p.add_argument("-o", "--output-dir", help="directory for outputs (default: next to each input)")
+        p.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1, help="worker processes (default: all cores)")
+        p.add_argument("-r", "--recursive", action="store_true", help="descend into subdirectories")
+        p.add_argument("-p", "--profile", action="store_true", help="report time and peak memory per codec stage")
+        p.add_argument("--force", action="store_true", help="overwrite output files that already exist")
+        if name == "compress":
+            p.add_argument("-m", "--mode", choices=COMPRESS_MODES, default="lossless")
+            p.add_argument("-b", "--block-size", type=int, default=myimg_codec.LOSSY_BLOCK_SIZE, help="lossy block size")
+            p.add_argument("-q", "--quality", type=int, default=myimg_codec.QUADTREE_QUALITY, help="lossy-quadtree quality, 0-100")
+        else:
+            p.add_argument("-s", "--stream", action="store_true",
+                           help="memory-map each file and decode it band by band, never holding the whole image")
+            p.add_argument("--band-pixels", type=int, default=myimg_codec.STREAM_BAND_PIXELS,
+                           help="pixels per band when streaming; lower it to cap memory per worker")
+            p.add_argument("-f", "--format", choices=("png", "raw"), default="png",
+                           help="output format; raw writes 8-bit RGB rows to .rgb files (implies --stream)")
+    return parser
+
+# Parses the command line, runs the batch and returns the process exit code.
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    compressing = args.command == "compress"
+    extensions = IMAGE_EXTENSIONS if compressing else ('.myimg',)
+    inputs = collect_inputs(args.inputs, extensions, args.recursive)
+    if not inputs:
+        print("No input files found.", file=sys.stderr)
+        return 1
+
+    if compressing:
+        jobs = [(p, output_path(p, ".myimg", args.output_dir), args.mode, args.block_size, args.quality, args.profile) for p in inputs]
+        func = compress_file
+    else:
+        band_pixels = args.band_pixels if args.stream or args.format == "raw" else None
+        extension = ".png" if args.format == "png" else ".rgb"
+        jobs = [(p, output_path(p, extension, args.output_dir), args.profile, band_pixels) for p in inputs]
+        func = decompress_file
+
+    duplicates = duplicate_outputs((job[0], job[1]) for job in jobs)
+    if duplicates:
+        for out, paths in sorted(duplicates.items()):
+            print(f"{out}: would be written by {', '.join(paths)}", file=sys.stderr)
+        print("Output names collide; rename the inputs or process them into separate directories.", file=sys.stderr)
+        return 1
+    # Decoding next to the inputs would otherwise replace e.g. photos/a.png by the decode of photos/a.myimg.
+    existing = [job[1] for job in jobs if os.path.exists(job[1])]
+    if existing and not args.force:
+        for out in existing:
+            print(f"{out}: already exists", file=sys.stderr)
+        print("Refusing to overwrite existing files; use -o to write elsewhere or --force to replace them.", file=sys.stderr)
+        return 1
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    results, failures = [], 0
+    start = time.perf_counter()
+    for job, stats, error in run_jobs(func, jobs, max(1, args.workers)):
+        if error is not None:
+            failures += 1
+            print(f"{os.path.basename(job[0])}: FAILED ({error})", file=sys.stderr)
+        else:
+            results.append(stats)
+            print(format_file_stats(stats, compressing))
+            if stats["stages"]:
+                print("\n".join("    " + line for line in format_stages(stats["stages"])))
+    print()
+    print(format_summary(results, failures, time.perf_counter() - start, compressing))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
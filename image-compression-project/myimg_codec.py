@@ -0,0 +1,1320 @@
+import os
+import mmap
+import zlib
+import struct
+import multiprocessing
+from collections import namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from PIL import Image
+import numpy as np
+import lzw
+from myimg_profile import stage, wrap_progress
+
+# Headless .myimg codec: every encoder/decoder used by the GUI lives here as a
+# plain module-level function, so workers and scripts can compress images
+# without importing tkinter or creating a window.
+#
+# Progress callbacks are optional. When given, they are called with an integer
+# percentage (0-100) from whichever thread runs the codec, between steps of the
+# codec loops; an exception raised by the callback (e.g. myimg_jobs.JobCancelled)
+# aborts the codec and propagates to the caller. Likewise, an optional profile
+# (myimg_profile.StageProfile) records time and memory per codec stage.
+
+MODE_LOSSLESS = 0
+MODE_LOSSLESS_VARIABLE = 1
+MODE_LOSSLESS_CLEAR = 2
+MODE_LOSSLESS_STRIPS = 3
+MODE_LOSSY = 4
+MODE_LOSSLESS_RGB = 5
+MODE_LOSSY_QUADTREE = 6
+MODE_LOSSY_ENTROPY = 7
+MODE_LOSSY_YCBCR = 8
+MODE_LOSSY_DEDUP = 9
+
+# Lossy modes with fixed-size BTC blocks and one chunk per block row (decode_region and
+# decode_thumbnail work on all of them).
+BTC_MODES = (MODE_LOSSY, MODE_LOSSY_ENTROPY, MODE_LOSSY_YCBCR, MODE_LOSSY_DEDUP)
+
+# Lossless modes that store an 8-bit palette and LZW-coded indices.
+PALETTE_MODES = (MODE_LOSSLESS, MODE_LOSSLESS_VARIABLE, MODE_LOSSLESS_CLEAR, MODE_LOSSLESS_STRIPS)
+LOSSLESS_MODES = PALETTE_MODES + (MODE_LOSSLESS_RGB,)
+# Mode -> (uses CLEAR codes, code packer, code unpacker, code slice reader).
+LOSSLESS_CODE_FORMATS = {
+    MODE_LOSSLESS: (False, lzw.pack_codes_fixed16, lzw.unpack_codes_fixed16, lzw.iter_unpack_codes_fixed16),
+    MODE_LOSSLESS_VARIABLE: (False, lzw.pack_codes_variable, lzw.unpack_codes_variable, lzw.iter_unpack_codes_variable),
+    MODE_LOSSLESS_CLEAR: (True, lambda codes: lzw.pack_codes_variable(codes, clear=True),
+                          lambda payload: lzw.unpack_codes_variable(payload, clear=True),
+                          lambda payload: lzw.iter_unpack_codes_variable(payload, clear=True)),
+}
+
+# Target pixels per strip in MODE_LOSSLESS_STRIPS: small enough to spread over many cores.
+STRIP_PIXELS = 1 << 18
+
+LOSSY_BLOCK_SIZE = 16
+# Pixels handled per vectorized band in the lossy codec; bounds temporary memory on huge images.
+LOSSY_BAND_PIXELS = 1 << 20
+# Deflate level of the entropy-coded lossy mode.
+LOSSY_ZLIB_LEVEL = 9
+
+# Quadtree lossy mode: largest and smallest block sizes and the default quality (0-100).
+QUADTREE_MAX_BLOCK = 64
+QUADTREE_MIN_BLOCK = 4
+QUADTREE_QUALITY = 75
+
+# Pixels scanned per band when collecting the exact colors of an image for the palette modes.
+PALETTE_BAND_PIXELS = 1 << 20
+
+# True-color mode: PNG row filter types, target pixels per chunk (band of rows), pixels filtered
+# per vectorized step (bounds temporary memory), and the deflate level (with the Z_FILTERED
+# strategy, as libpng uses for filtered rows).
+FILTER_NONE, FILTER_SUB, FILTER_UP, FILTER_AVERAGE, FILTER_PAETH = range(5)
+RGB_BAND_PIXELS = 1 << 22
+RGB_FILTER_PIXELS = 1 << 20
+RGB_ZLIB_LEVEL = 6
+
+# Target pixels per band yielded by the streaming decoder (one true-color band, so mode 5 is not
+# cut into shorter bands by default), and compressed bytes fed to zlib per step when a band needs
+# only part of a deflate stream.
+STREAM_BAND_PIXELS = RGB_BAND_PIXELS
+INFLATE_INPUT_BYTES = 1 << 16
+# Pixels filtered per step when writing PNG output band by band.
+PNG_FILTER_PIXELS = 1 << 16
+
+# Number of set bits in every byte value, for counting mask bits without unpacking them.
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+# .myimg v2 container: magic, version, mode, flags, 32-bit width/height, a mode parameter (block
+# size or strip height) and a chunk table of (offset, length, CRC-32) entries, closed by a CRC-32
+# of everything before it. v1 files start directly with their mode byte, which is never 0x89.
+CONTAINER_MAGIC = b"\x89MYIMG\r\n"
+CONTAINER_VERSION = 2
+CONTAINER_HEADER = struct.Struct(">8sBBHIIII")
+CHUNK_ENTRY = struct.Struct(">QII")
+
+# Header flag bits. FLAG_QUANTIZED marks a palette-mode file whose image had more than 256 colors
+# and was reduced to an adaptive palette, so decoding does not give back the exact input.
+FLAG_QUANTIZED = 0x0001
+
+# Parsed .myimg file. chunks are zero-copy memoryviews into the input; crcs is None and flags 0 for v1 files.
+MyImgFile = namedtuple("MyImgFile", "version mode width height param chunks crcs flags", defaults=(0,))
+
+# ===================== UTILITY FUNCTIONS ==================
+
+# Formats a byte count into a human-readable string (KB or MB).
+def fmt_size(n_bytes):
+    kb = n_bytes / 1024
+    if kb < 1024:
+        return f"{kb:,.2f} KB"
+    else:
+        mb = kb / 1024
+        return f"{mb:,.2f} MB"
+
+
+# ===================== CONTAINER (.myimg v2) =====================
+
+# Serializes a v2 container from the mode, image size, mode parameter, chunk payloads and header flags.
+def write_container(mode, width, height, param, chunks, flags=0):
+    table_size = CONTAINER_HEADER.size + CHUNK_ENTRY.size * len(chunks) + 4
+    parts = [CONTAINER_HEADER.pack(CONTAINER_MAGIC, CONTAINER_VERSION, mode, flags, width, height, param, len(chunks))]
+    offset = table_size
+    for chunk in chunks:
+        parts.append(CHUNK_ENTRY.pack(offset, len(chunk), zlib.crc32(chunk)))
+        offset += len(chunk)
+    header = b''.join(parts)
+    return header + struct.pack(">I", zlib.crc32(header)) + b''.join(chunks)
+
+# Returns True if the data starts with the v2 container signature.
+def is_container(data):
+    return bytes(data[:len(CONTAINER_MAGIC)]) == CONTAINER_MAGIC
+
+# Parses any .myimg stream (v1 or v2) into a MyImgFile without decoding pixels (a MyImgFile is
+# returned unchanged).
+# v2 headers and chunk tables are always validated; with verify, every chunk CRC is checked too,
+# which rejects corrupt files before any heavy decoding work.
+def read_container(data, verify=True):
+    if isinstance(data, MyImgFile):
+        return data
+    view = memoryview(data).cast('B') if not isinstance(data, memoryview) else data
+    if not is_container(view):
+        return _read_v1(view)
+    if len(view) < CONTAINER_HEADER.size + 4:
+        raise ValueError("Truncated .myimg header")
+    magic, version, mode, flags, width, height, param, n_chunks = CONTAINER_HEADER.unpack_from(view)
+    if version != CONTAINER_VERSION:
+        raise ValueError(f"Unsupported .myimg version: {version}")
+    table_end = CONTAINER_HEADER.size + CHUNK_ENTRY.size * n_chunks
+    if len(view) < table_end + 4:
+        raise ValueError("Truncated .myimg chunk table")
+    (header_crc,) = struct.unpack_from(">I", view, table_end)
+    if zlib.crc32(view[:table_end]) != header_crc:
+        raise ValueError("Corrupt .myimg header (CRC mismatch)")
+    chunks, crcs = [], []
+    for i in range(n_chunks):
+        offset, length, crc = CHUNK_ENTRY.unpack_from(view, CONTAINER_HEADER.size + CHUNK_ENTRY.size * i)
+        if offset + length > len(view):
+            raise ValueError(f"Chunk {i} extends past the end of the file")
+        chunks.append(view[offset:offset + length])
+        crcs.append(crc)
+    f = MyImgFile(version, mode, width, height, param, chunks, crcs, flags)
+    if verify:
+        verify_chunks(f)
+    return f
+
+# Checks the CRC-32 of the given chunks (all by default); v1 files have no checksums to verify.
+def verify_chunks(f, indices=None):
+    if f.crcs is None:
+        return
+    for i in (range(len(f.chunks)) if indices is None else indices):
+        if zlib.crc32(f.chunks[i]) != f.crcs[i]:
+            raise ValueError(f"Corrupt .myimg chunk {i} (CRC mismatch)")
+
+# Maps a v1 stream (bare mode byte + >BHH/>BHHB/>BHHH header) onto the same chunk layout v2 uses.
+def _read_v1(view):
+    if len(view) < 5:
+        raise ValueError("Invalid compressed file format")
+    mode = view[0]
+    if mode in (MODE_LOSSLESS, MODE_LOSSLESS_VARIABLE, MODE_LOSSLESS_CLEAR):
+        if len(view) < 5 + 768:
+            raise ValueError("Invalid compressed file format")
+        _, w, h = struct.unpack_from(">BHH", view)
+        return MyImgFile(1, mode, w, h, 0, [view[5:5 + 768], view[5 + 768:]], None)
+    if mode == MODE_LOSSLESS_STRIPS:
+        if len(view) < 7 + 768:
+            raise ValueError("Invalid compressed file format")
+        _, w, h, strip_rows = struct.unpack_from(">BHHH", view)
+        if strip_rows == 0:
+            raise ValueError("Invalid strip height")
+        n_strips = (h + strip_rows - 1) // strip_rows
+        body_start = 7 + 768 + 4 * n_strips
+        if len(view) < body_start:
+            raise ValueError("Truncated strip offset table")
+        ends = struct.unpack_from(f">{n_strips}I", view, 7 + 768)
+        chunks = [view[7:7 + 768]]
+        start = 0
+        for end in ends:
+            if end < start or body_start + end > len(view):
+                raise ValueError("Corrupt strip offset table")
+            chunks.append(view[body_start + start:body_start + end])
+            start = end
+        return MyImgFile(1, mode, w, h, strip_rows, chunks, None)
+    if mode == MODE_LOSSY:
+        if len(view) < 6:
+            raise ValueError("Invalid compressed file format")
+        _, w, h, block_size = struct.unpack_from(">BHHB", view)
+        if block_size == 0:
+            raise ValueError("Invalid block size")
+        offsets, body_len = _lossy_block_offsets(w, h, block_size)
+        if len(view) < 6 + body_len:
+            raise ValueError("Truncated lossy compressed data")
+        row_starts = offsets[:, 0].tolist() + [body_len]
+        chunks = [view[6 + a:6 + b] for a, b in zip(row_starts[:-1], row_starts[1:])]
+        return MyImgFile(1, mode, w, h, block_size, chunks, None)
+    raise ValueError(f"Unknown .myimg mode: {mode}")
+
+
+# ===================== LOSSLESS (LZW) CODEC =====================
+
+# Returns the exact palette (sorted packed 0xRRGGBB colors) and index array of an RGB array, or
+# None if it has more than 256 colors. Colors are marked in a 2**24-entry table band by band, so
+# an image with many colors is usually rejected after its first band; indices come from a lookup
+# table instead of sorting.
+def _exact_palette(rgb):
+    h, w, _ = rgb.shape
+    band_rows = max(1, PALETTE_BAND_PIXELS // max(1, w))
+    seen = np.zeros(1 << 24, dtype=bool)
+    for y in range(0, h, band_rows):
+        seen[_pack_rgb(rgb[y:y + band_rows])] = True
+        if np.count_nonzero(seen) > 256:
+            return None
+    colors = np.flatnonzero(seen).astype(np.uint32)
+    lookup = np.zeros(1 << 24, dtype=np.uint8)
+    lookup[colors] = np.arange(len(colors), dtype=np.uint8)
+    arr = np.empty((h, w), dtype=np.uint8)
+    for y in range(0, h, band_rows):
+        arr[y:y + band_rows] = lookup[_pack_rgb(rgb[y:y + band_rows])]
+    return colors, arr
+
+# Packs the RGB pixels of an (h, w, 3) uint8 array into 0xRRGGBB integers.
+def _pack_rgb(rgb):
+    rgb = rgb.astype(np.uint32)
+    return (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+
+# Converts the image to 8-bit palette indices; returns the index array, the 768-byte palette and
+# whether the colors had to be quantized. Images with at most 256 colors keep their exact colors
+# (truly lossless, and much faster than PIL's adaptive quantizer); others get an adaptive palette.
+def _palettize(img):
+    rgb = np.asarray(img.convert("RGB"))
+    exact = _exact_palette(rgb)
+    if exact is not None:
+        colors, arr = exact
+        palette = np.zeros((256, 3), dtype=np.uint8)
+        palette[:len(colors), 0] = colors >> 16
+        palette[:len(colors), 1] = colors >> 8
+        palette[:len(colors), 2] = colors
+        return arr, palette.tobytes(), False
+    pal_img = img.convert("P", palette=Image.Palette.ADAPTIVE, colors=256)
+    arr = np.array(pal_img)
+    palette_bytes = bytes(pal_img.getpalette()[:256*3])
+    palette_bytes = palette_bytes + bytes(768 - len(palette_bytes))
+    return arr, palette_bytes, True
+
+# Turns a palette index array back into an RGB image.
+def _depalettize(arr, palette):
+    pal_img = Image.fromarray(arr, mode='P')
+    pal_img.putpalette(list(bytes(palette)))
+    return pal_img.convert('RGB')
+
+# Applies LZW-based lossless compression to an 8-bit palettized copy of the image.
+# MODE_LOSSLESS_CLEAR packs codes with growing 9-12 bit widths and resets the dictionary when it
+# fills; MODE_LOSSLESS_VARIABLE uses the same packing with a frozen dictionary; MODE_LOSSLESS writes
+# the original fixed 16-bit codes. MODE_LOSSLESS_STRIPS and MODE_LOSSLESS_RGB are handed to
+# encode_lossless_strips and encode_lossless_rgb.
+# Chunks: palette, code stream.
+def encode_lossless(img, mode=MODE_LOSSLESS_CLEAR, workers=None, progress=None, profile=None):
+    if mode == MODE_LOSSLESS_STRIPS:
+        return encode_lossless_strips(img, workers=workers, progress=progress, profile=profile)
+    if mode == MODE_LOSSLESS_RGB:
+        return encode_lossless_rgb(img, progress=progress, profile=profile)
+    if mode not in LOSSLESS_CODE_FORMATS:
+        raise ValueError(f"Unsupported lossless mode: {mode}")
+    clear, pack_codes, _, _ = LOSSLESS_CODE_FORMATS[mode]
+    progress = wrap_progress(profile, progress)
+    with stage(profile, "palette convert"):
+        arr, palette_bytes, quantized = _palettize(img)
+    with stage(profile, "lzw encode"):
+        output = lzw.lzw_encode(arr.tobytes(), clear=clear, progress=progress)
+    with stage(profile, "pack codes"):
+        out_bytes = pack_codes(output)
+    h_img, w_img = arr.shape
+    with stage(profile, "write container"):
+        return write_container(mode, w_img, h_img, 0, [palette_bytes, out_bytes], FLAG_QUANTIZED if quantized else 0)
+
+# Reconstructs the original image from LZW-compressed data and palette information.
+def decode_lossless(data, workers=None, progress=None, profile=None):
+    with stage(profile, "read container"):
+        f = read_container(data)
+    if f.mode == MODE_LOSSLESS_STRIPS:
+        return decode_lossless_strips(f, workers=workers, progress=progress, profile=profile)
+    if f.mode == MODE_LOSSLESS_RGB:
+        return decode_lossless_rgb(f, progress=progress, profile=profile)
+    if f.mode not in LOSSLESS_CODE_FORMATS or len(f.chunks) != 2:
+        raise ValueError(f"Unsupported lossless mode: {f.mode}")
+    clear, _, unpack_codes, _ = LOSSLESS_CODE_FORMATS[f.mode]
+    progress = wrap_progress(profile, progress)
+    with stage(profile, "unpack codes"):
+        codes = unpack_codes(f.chunks[1])
+    with stage(profile, "lzw decode"):
+        result = lzw.lzw_decode(codes, f.width * f.height, clear=clear, progress=progress)
+    with stage(profile, "palette expand"):
+        arr = np.frombuffer(result, dtype='uint8').reshape((f.height, f.width))
+        return _depalettize(arr, f.chunks[0])
+
+
+# ===================== PARALLEL STRIP CODEC =====================
+
+# Worker: LZW-encodes one strip of palette indices (CLEAR codes, variable widths).
+def _encode_strip(strip_bytes):
+    return lzw.pack_codes_variable(lzw.lzw_encode(strip_bytes, clear=True), clear=True)
+
+# Worker: decodes one strip of out_size palette indices.
+def _decode_strip(payload, out_size):
+    codes = lzw.unpack_codes_variable(payload, clear=True)
+    return lzw.lzw_decode(codes, out_size, clear=True)
+
+# Runs func over items (argument tuples), in a process pool when more than one worker is useful,
+# and returns the results in order. Progress is aggregated from finished items, weighted by their sizes.
+def _run_strips(func, items, weights, workers=None, progress=None):
+    workers = min(workers or os.cpu_count() or 1, len(items))
+    total_weight = sum(weights) or 1
+    done_weight = 0
+    results = [None] * len(items)
+    if workers <= 1:
+        for i, item in enumerate(items):
+            results[i] = func(*item)
+            done_weight += weights[i]
+            if progress is not None:
+                progress(int((done_weight / total_weight) * 100))
+        return results
+    # Spawned (not forked) workers, since callers such as the GUI run this from a background thread.
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {pool.submit(func, *item): i for i, item in enumerate(items)}
+        try:
+            for future in as_completed(futures):
+                i = futures[future]
+                results[i] = future.result()
+                done_weight += weights[i]
+                if progress is not None:
+                    progress(int((done_weight / total_weight) * 100))
+        except BaseException:
+            # Failed or cancelled (e.g. by the progress callback): drop the strips not started yet.
+            for future in futures:
+                future.cancel()
+            raise
+    return results
+
+# Splits the palettized image into horizontal strips and LZW-encodes each one independently in a
+# process pool. Chunks: palette, then one chunk per strip; the container's chunk table lets the
+# strips be located and decoded in parallel as well. The parameter is the strip height.
+def encode_lossless_strips(img, workers=None, strip_rows=None, progress=None, profile=None):
+    progress = wrap_progress(profile, progress)
+    with stage(profile, "palette convert"):
+        arr, palette_bytes, quantized = _palettize(img)
+    h, w = arr.shape
+    if strip_rows is None:
+        strip_rows = max(1, min(h, STRIP_PIXELS // max(1, w)))
+    strips = [(arr[y:y + strip_rows].tobytes(),) for y in range(0, h, strip_rows)]
+    with stage(profile, "lzw encode strips"):
+        payloads = _run_strips(_encode_strip, strips, [len(b[0]) for b in strips], workers, progress)
+    with stage(profile, "write container"):
+        return write_container(MODE_LOSSLESS_STRIPS, w, h, strip_rows, [palette_bytes] + payloads,
+                               FLAG_QUANTIZED if quantized else 0)
+
+# Decodes a strip-based lossless file, decoding the strips in a process pool.
+def decode_lossless_strips(data, workers=None, progress=None, profile=None):
+    with stage(profile, "read container"):
+        f = read_container(data)
+    if f.param == 0 or len(f.chunks) != 1 + (f.height + f.param - 1) // f.param:
+        raise ValueError("Strip table does not match image height")
+    progress = wrap_progress(profile, progress)
+    rows = f.param
+    jobs = [(bytes(chunk), min(rows, f.height - i * rows) * f.width) for i, chunk in enumerate(f.chunks[1:])]
+    with stage(profile, "lzw decode strips"):
+        strips = _run_strips(_decode_strip, jobs, [len(job[0]) for job in jobs], workers, progress)
+
+    with stage(profile, "palette expand"):
+        arr = np.empty((f.height, f.width), dtype=np.uint8)
+        for i, strip in enumerate(strips):
+            arr[i * rows:(i + 1) * rows] = np.frombuffer(strip, dtype=np.uint8).reshape(-1, f.width)
+        return _depalettize(arr, f.chunks[0])
+
+
+# ===================== TRUE-COLOR PREDICTIVE CODEC =====================
+
+# PNG Paeth predictor on int16 arrays: whichever of left, up, up-left is closest to left + up - up-left.
+def _paeth(a, b, c):
+    pa = np.abs(b - c)
+    pb = np.abs(a - c)
+    pc = np.abs(a + b - 2 * c)
+    return np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+
+# Filters a band of RGB rows (bh, w, 3) whose previous row is prev (w, 3; zeros for the first band).
+# Every row is tried with all five PNG filters and keeps the one with the smallest sum of absolute
+# (signed) residuals, PNG's usual heuristic. Returns (filter types, residual bytes).
+def _filter_rgb_band(band, prev):
+    x = band.astype(np.int16)
+    up = np.concatenate([prev[None].astype(np.int16), x[:-1]])
+    left = np.zeros_like(x)
+    left[:, 1:] = x[:, :-1]
+    up_left = np.zeros_like(x)
+    up_left[:, 1:] = up[:, :-1]
+    predictors = (0, left, up, (left + up) >> 1, _paeth(left, up, up_left))
+
+    best_cost = best = types = None
+    for filter_type, prediction in enumerate(predictors):
+        residual = (x - prediction).astype(np.uint8)
+        cost = np.abs(residual.view(np.int8).astype(np.int32)).sum(axis=(1, 2))
+        if best is None:
+            best_cost, best, types = cost, residual, np.zeros(len(x), dtype=np.uint8)
+            continue
+        better = cost < best_cost
+        best_cost = np.where(better, cost, best_cost)
+        best[better] = residual[better]
+        types[better] = filter_type
+    return types, best
+
+# Undoes the row filters of one band in place. out is (bh + 1, w + 1, 3) uint8 with the previous
+# row in out[0] and a zero column in out[:, 0]; residuals are (bh, w, 3).
+# Sub, Average and Paeth depend on the already decoded left neighbour, so rows cannot be undone one
+# vectorized row at a time. Instead the band is swept along anti-diagonals: every pixel on
+# diagonal row + col = k only needs pixels of earlier diagonals, so each diagonal is one vectorized
+# step over all its rows, whatever filter each row uses. In the flattened padded layout a diagonal
+# is a plain strided slice, so no index arrays are built.
+def _unfilter_rgb_band(out, residuals, types):
+    bh, w, _ = residuals.shape
+    stride = w + 1
+    flat = out.reshape(-1, 3)
+    res = residuals.reshape(-1, 3)
+    types = types.astype(np.int16)
+    for k in range(bh + w - 1):
+        r0, r1 = max(0, k - w + 1), min(bh, k + 1)
+        # Pixel (r, k - r) sits at (r + 1) * stride + (k - r) + 1 in out and r * w + (k - r) in res.
+        start = (r0 + 1) * stride + k - r0 + 1
+        idx = slice(start, start + (r1 - r0 - 1) * w + 1, w)
+        a = flat[start - 1:start - 1 + (r1 - r0 - 1) * w + 1:w].astype(np.int16)
+        b = flat[start - stride:start - stride + (r1 - r0 - 1) * w + 1:w].astype(np.int16)
+        c = flat[start - stride - 1:start - stride - 1 + (r1 - r0 - 1) * w + 1:w].astype(np.int16)
+        t = types[r0:r1, None]
+        prediction = np.where(t == FILTER_SUB, a, 0)
+        prediction = np.where(t == FILTER_UP, b, prediction)
+        prediction = np.where(t == FILTER_AVERAGE, (a + b) >> 1, prediction)
+        prediction = np.where(t == FILTER_PAETH, _paeth(a, b, c), prediction)
+        rstart = r0 * w + k - r0
+        rstep = max(1, w - 1)
+        flat[idx] = (res[rstart:rstart + (r1 - r0 - 1) * rstep + 1:rstep] + prediction).astype(np.uint8)
+
+# Number of rows per chunk in the true-color mode.
+def _rgb_band_rows(w):
+    return max(1, RGB_BAND_PIXELS // max(1, w))
+
+# Genuine 24-bit lossless compression: every row of the RGB image is run through the best of the
+# PNG filters (None/Sub/Up/Average/Paeth), and the decorrelated residuals are deflated with zlib,
+# which codes them far faster than the pure-Python LZW engine could.
+# Chunks: one filter-type byte per row, then one zlib stream per band of rows. The parameter is the
+# band height, so bands can be located (and later streamed) independently.
+def encode_lossless_rgb(img, progress=None, profile=None):
+    progress = wrap_progress(profile, progress)
+    with stage(profile, "rgb convert"):
+        arr = np.asarray(img.convert("RGB"))
+    h, w, _ = arr.shape
+    band_rows = _rgb_band_rows(w)
+    filter_rows = max(1, RGB_FILTER_PIXELS // max(1, w))
+    types, chunks = [], []
+    prev = np.zeros((w, 3), dtype=np.uint8)
+    for y0 in range(0, h, band_rows):
+        compressor = zlib.compressobj(RGB_ZLIB_LEVEL, zlib.DEFLATED, 15, 9, zlib.Z_FILTERED)
+        parts = []
+        for y in range(y0, min(y0 + band_rows, h), filter_rows):
+            rows = arr[y:min(y + filter_rows, y0 + band_rows, h)]
+            with stage(profile, "row filters"):
+                row_types, residuals = _filter_rgb_band(rows, prev)
+            with stage(profile, "zlib compress"):
+                parts.append(compressor.compress(residuals.tobytes()))
+            types.append(row_types)
+            prev = rows[-1]
+            if progress is not None:
+                progress(int((min(y + filter_rows, h) / h) * 100))
+        parts.append(compressor.flush())
+        chunks.append(b"".join(parts))
+    filter_bytes = np.concatenate(types).tobytes() if types else b""
+    with stage(profile, "write container"):
+        return write_container(MODE_LOSSLESS_RGB, w, h, band_rows, [filter_bytes] + chunks)
+
+# Checks a true-color file's band table and returns its row filter types.
+def _lossless_rgb_types(f):
+    if f.mode != MODE_LOSSLESS_RGB or f.param == 0:
+        raise ValueError(f"Not a true-color lossless .myimg stream (mode {f.mode})")
+    if len(f.chunks) != 1 + (f.height + f.param - 1) // f.param or len(f.chunks[0]) != f.height:
+        raise ValueError("Band table does not match image height")
+    types = np.frombuffer(f.chunks[0], dtype=np.uint8)
+    if types.size and types.max() > FILTER_PAETH:
+        raise ValueError("Invalid row filter type")
+    return types
+
+# Yields the pieces of one zlib stream, exactly sizes[i] bytes each, without inflating (or copying)
+# more than one piece at a time. The stream must end exactly after the last piece.
+def _inflate_pieces(data, sizes, name):
+    inflater = zlib.decompressobj()
+    view = memoryview(data)
+    pos, tail = 0, b""
+    try:
+        for size in sizes:
+            parts, got = [], 0
+            while got < size and not inflater.eof:
+                if not tail:
+                    if pos >= len(view):
+                        break
+                    tail = view[pos:pos + INFLATE_INPUT_BYTES]
+                    pos += INFLATE_INPUT_BYTES
+                parts.append(inflater.decompress(tail, size - got))
+                tail = inflater.unconsumed_tail
+                got += len(parts[-1])
+            if got != size:
+                raise ValueError(f"Wrong decoded size in {name}")
+            yield b"".join(parts)
+        if inflater.decompress(bytes(tail) + bytes(view[pos:]), 1) or not inflater.eof:
+            raise ValueError(f"Wrong decoded size in {name}")
+    except zlib.error as e:
+        raise ValueError(f"Corrupt {name}: {e}") from None
+
+# Decodes a true-color file as (y0, rows) bands of at most band_rows rows: inflate the residuals,
+# then undo the row filters. Rows are inflated piece by piece, so bands can be much smaller than
+# the file's own bands.
+def _iter_lossless_rgb(f, types, band_rows, progress=None, profile=None):
+    w, h, chunk_rows = f.width, f.height, f.param
+    band_rows = min(band_rows, chunk_rows)
+    out = np.zeros((band_rows + 1, w + 1, 3), dtype=np.uint8)
+    for i, chunk in enumerate(f.chunks[1:]):
+        y0 = i * chunk_rows
+        starts = range(y0, min(y0 + chunk_rows, h), band_rows)
+        heights = [min(y + band_rows, y0 + chunk_rows, h) - y for y in starts]
+        pieces = _inflate_pieces(chunk, [bh * w * 3 for bh in heights], f"true-color band {i}")
+        for y, bh in zip(starts, heights):
+            with stage(profile, "zlib decompress"):
+                raw = next(pieces)
+            with stage(profile, "undo row filters"):
+                band = out[:bh + 1]
+                _unfilter_rgb_band(band, np.frombuffer(raw, dtype=np.uint8).reshape(bh, w, 3), types[y:y + bh])
+                rows = band[1:, 1:].copy()
+                out[0, 1:] = band[bh, 1:]
+            if progress is not None:
+                progress(int(((y + bh) / h) * 100))
+            yield y, rows
+        with stage(profile, "zlib decompress"):
+            next(pieces, None)
+
+# Decodes a true-color file band by band: inflate the residuals, then undo the row filters.
+def decode_lossless_rgb(data, progress=None, profile=None):
+    with stage(profile, "read container"):
+        f = read_container(data)
+    types = _lossless_rgb_types(f)
+    arr = np.empty((f.height, f.width, 3), dtype=np.uint8)
+    for y0, rows in _iter_lossless_rgb(f, types, f.param, wrap_progress(profile, progress), profile):
+        arr[y0:y0 + len(rows)] = rows
+    return Image.fromarray(arr, "RGB")
+
+
+# ===================== LOSSY (BLOCK) CODEC =====================
+
+# Returns the byte offset of every block record inside a lossy body (blocks_y x blocks_x) and the body length.
+# A record is level_bytes level bytes (6 RGB bytes in mode 4) plus the packed mask, so its size
+# depends only on the block geometry.
+def _lossy_block_offsets(w, h, block_size, level_bytes=6):
+    blocks_y = (h + block_size - 1) // block_size
+    blocks_x = (w + block_size - 1) // block_size
+    bh = np.full(blocks_y, block_size, dtype=np.int64)
+    bw = np.full(blocks_x, block_size, dtype=np.int64)
+    if blocks_y:
+        bh[-1] = h - (blocks_y - 1) * block_size
+    if blocks_x:
+        bw[-1] = w - (blocks_x - 1) * block_size
+    record_len = level_bytes + (bh[:, None] * bw[None, :] + 7) // 8
+    ends = np.cumsum(record_len.ravel())
+    offsets = (ends - record_len.ravel()).reshape(blocks_y, blocks_x)
+    return offsets, int(ends[-1]) if ends.size else 0
+
+# Encodes a stack of same-sized planar blocks (n, 3, pixels) into their records (n, 6 + mask bytes).
+# Mirrors the per-block arithmetic exactly: float64 luma mean, >= threshold, truncated channel means.
+def _btc_block_records(blocks):
+    gray = (0.2989 * blocks[:, 0] + 0.587 * blocks[:, 1] + 0.114 * blocks[:, 2])
+    mean = gray.mean(axis=1)
+    mask = gray >= mean[:, None]
+    los, his = _btc_levels(blocks, mask)
+    mask_bytes = np.packbits(mask, axis=1)
+    return np.concatenate([los.astype(np.uint8), his.astype(np.uint8), mask_bytes], axis=1)
+
+# Returns the truncated mean of each channel of blocks (n, channels, pixels) over the pixels where
+# mask (n, pixels) is False (lo) and True (hi). A side with no pixels gets the block's mean.
+# Channel sums go through float matmuls: float32 while a block's sums stay below 2**24, where
+# it is exact (blocks up to 255x255), float64 for larger blocks.
+def _btc_levels(blocks, mask):
+    n_pixels = blocks.shape[2]
+    dtype = np.float32 if n_pixels * 255 < 1 << 24 else np.float64
+    values = blocks.astype(dtype)
+    total = values.sum(axis=2).astype(np.int64)
+    sum_hi = np.matmul(values, mask.astype(dtype)[:, :, None])[:, :, 0].astype(np.int64)
+    sum_lo = total - sum_hi
+    count_hi = mask.sum(axis=1, dtype=np.int64)[:, None]
+    count_lo = n_pixels - count_hi
+    mean_all = total // n_pixels
+    his = np.where(count_hi > 0, sum_hi // np.maximum(count_hi, 1), mean_all)
+    los = np.where(count_lo > 0, sum_lo // np.maximum(count_lo, 1), mean_all)
+    return los, his
+
+# Expands mode-4 records (n, 6 + mask bytes) into their blocks' RGB pixels (n, n_pixels, 3).
+def _btc_block_pixels(records, n_pixels):
+    mask = np.unpackbits(records[:, 6:], axis=1, count=n_pixels).astype(bool)
+    return np.where(mask[:, :, None], records[:, None, 3:6], records[:, None, 0:3])
+
+# Encodes planar YCbCr blocks (n, 3, pixels) into YCbCr records (n, 4 + mask bytes): the luma
+# plane is BTC coded at full resolution (lo Y, hi Y and the mask) and the chroma is subsampled to
+# one truncated Cb/Cr mean per block.
+def _ycbcr_block_records(blocks):
+    n_pixels = blocks.shape[2]
+    luma = blocks[:, :1]
+    mask = luma[:, 0] >= luma[:, 0].mean(axis=1)[:, None]
+    los, his = _btc_levels(luma, mask)
+    chroma = blocks[:, 1:].sum(axis=2, dtype=np.int64) // n_pixels
+    mask_bytes = np.packbits(mask, axis=1)
+    return np.concatenate([los.astype(np.uint8), his.astype(np.uint8), chroma.astype(np.uint8), mask_bytes], axis=1)
+
+# Expands YCbCr records into their blocks' YCbCr pixels (n, n_pixels, 3).
+def _ycbcr_block_pixels(records, n_pixels):
+    mask = np.unpackbits(records[:, 4:], axis=1, count=n_pixels).astype(bool)
+    pixels = np.empty((len(records), n_pixels, 3), dtype=np.uint8)
+    pixels[:, :, 0] = np.where(mask, records[:, 1:2], records[:, 0:1])
+    pixels[:, :, 1:] = records[:, None, 2:4]
+    return pixels
+
+# Mean color of each block from its records and its number of hi pixels (n, 1), for thumbnails.
+def _btc_block_means(records, count_hi, n_pixels):
+    return (records[:, 0:3] * (n_pixels - count_hi) + records[:, 3:6] * count_hi) // n_pixels
+
+def _ycbcr_block_means(records, count_hi, n_pixels):
+    luma = (records[:, 0:1] * (n_pixels - count_hi) + records[:, 1:2] * count_hi) // n_pixels
+    return np.concatenate([luma, records[:, 2:4]], axis=1)
+
+# Mode -> (Pillow color space of the blocks, level bytes per record, record encoder, pixel
+# expander, block mean). The entropy-coded mode is expanded to mode 4 before decoding.
+LOSSY_RECORD_FORMATS = {
+    MODE_LOSSY: ("RGB", 6, _btc_block_records, _btc_block_pixels, _btc_block_means),
+    MODE_LOSSY_YCBCR: ("YCbCr", 4, _ycbcr_block_records, _ycbcr_block_pixels, _ycbcr_block_means),
+}
+
+# Splits block rows into bands of at most LOSSY_BAND_PIXELS pixels whose blocks share one height.
+# Yields (by0, by1, bh); only the last block row can be shorter than block_size.
+def _lossy_row_groups(w, h, block_size):
+    blocks_y = (h + block_size - 1) // block_size
+    full_y = h // block_size
+    band_rows = max(1, LOSSY_BAND_PIXELS // max(1, block_size * w))
+    for by0 in range(0, full_y, band_rows):
+        yield by0, min(by0 + band_rows, full_y), block_size
+    if blocks_y > full_y:
+        yield full_y, blocks_y, h - full_y * block_size
+
+# Returns the (bx0, bx1, bw) column groups whose blocks share one width: full blocks, then the ragged edge.
+def _lossy_column_groups(w, block_size):
+    full_x = w // block_size
+    groups = [(0, full_x, block_size)] if full_x else []
+    if w > full_x * block_size:
+        groups.append((full_x, full_x + 1, w - full_x * block_size))
+    return groups
+
+# Encodes block rows that all share block height bh into out, at the given per-block offsets.
+def _encode_lossy_rows(rows, out, offsets, bh, block_size, block_records=_btc_block_records):
+    n_rows = offsets.shape[0]
+    for bx0, bx1, bw in _lossy_column_groups(rows.shape[1], block_size):
+        region = rows[:, bx0 * block_size:bx0 * block_size + (bx1 - bx0) * bw]
+        blocks = region.reshape(n_rows, bh, bx1 - bx0, bw, 3).transpose(0, 2, 4, 1, 3).reshape(-1, 3, bh * bw)
+        records = block_records(blocks)
+        offs = offsets[:, bx0:bx1].ravel()
+        out[offs[:, None] + np.arange(records.shape[1])] = records
+
+# Decodes block rows that all share block height bh from body (records at the given offsets) into rows.
+# Records are gathered by offset, all masks are unpacked in one call and lo/hi colors are broadcast.
+def _decode_lossy_rows(body, rows, offsets, bh, block_size, mode=MODE_LOSSY):
+    _, level_bytes, _, block_pixels, _ = LOSSY_RECORD_FORMATS[mode]
+    n_rows = offsets.shape[0]
+    for bx0, bx1, bw in _lossy_column_groups(rows.shape[1], block_size):
+        n_pixels = bh * bw
+        offs = offsets[:, bx0:bx1].ravel()
+        records = body[offs[:, None] + np.arange(level_bytes + (n_pixels + 7) // 8)]
+        pixels = block_pixels(records, n_pixels)
+        region = rows[:, bx0 * block_size:bx0 * block_size + (bx1 - bx0) * bw]
+        region.reshape(n_rows, bh, bx1 - bx0, bw, 3).swapaxes(1, 2)[...] = pixels.reshape(n_rows, bx1 - bx0, bh, bw, 3)
+
+# Performs lossy image compression using block-wise average color masking and bit packing.
+# All blocks of a band of block rows are encoded at once with NumPy. Chunks: one per block row,
+# each holding that row's block records in the original layout. The parameter is the block size.
+# With entropy, each row's records go through a second stage instead (MODE_LOSSY_ENTROPY, see
+# _pack_lossy_row); the decoded image is the same. With ycbcr, blocks are coded in YCbCr with
+# full-resolution luma and one chroma pair per block (MODE_LOSSY_YCBCR): 4 level bytes per
+# block instead of 6, at the cost of color detail inside a block. With dedup, every distinct
+# record is stored once and blocks refer to it by index (MODE_LOSSY_DEDUP, see _dedup_lossy_records).
+def encode_lossy(img, block_size=LOSSY_BLOCK_SIZE, entropy=False, ycbcr=False, dedup=False, progress=None, profile=None):
+    if entropy + ycbcr + dedup > 1:
+        raise ValueError("Choose at most one of entropy, ycbcr and dedup")
+    if dedup and block_size > 255:
+        raise ValueError("The deduplicated lossy mode supports block sizes up to 255")
+    mode = MODE_LOSSY_YCBCR if ycbcr else MODE_LOSSY
+    color_space, level_bytes, block_records, _, _ = LOSSY_RECORD_FORMATS[mode]
+    progress = wrap_progress(profile, progress)
+    with stage(profile, f"{color_space.lower()} convert"):
+        arr = np.asarray(img.convert(color_space))
+    h, w, _ = arr.shape
+    offsets, body_len = _lossy_block_offsets(w, h, block_size, level_bytes)
+    out = np.empty(body_len, dtype=np.uint8)
+
+    with stage(profile, "block encode"):
+        for by0, by1, bh in _lossy_row_groups(w, h, block_size):
+            rows = arr[by0 * block_size:by0 * block_size + (by1 - by0) * bh]
+            _encode_lossy_rows(rows, out, offsets[by0:by1], bh, block_size, block_records)
+            if progress is not None:
+                progress(int((by1 / offsets.shape[0]) * 100))
+
+    row_starts = offsets[:, 0].tolist() + [body_len]
+    if entropy:
+        with stage(profile, "entropy code"):
+            chunks = [_pack_lossy_row(out[a:b], offsets[by] - a) for by, (a, b) in enumerate(zip(row_starts[:-1], row_starts[1:]))]
+        with stage(profile, "write container"):
+            return write_container(MODE_LOSSY_ENTROPY, w, h, block_size, chunks)
+    if dedup:
+        with stage(profile, "dedup blocks"):
+            new, index = _dedup_lossy_records(out, offsets, body_len)
+            index_bytes = 2 if len(index) == 0 or index.max() < 1 << 16 else 4
+            chunks = _pack_dedup_rows(out, offsets, body_len, new, index, index_bytes)
+        with stage(profile, "write container"):
+            return write_container(MODE_LOSSY_DEDUP, w, h, (index_bytes << 8) | block_size, chunks)
+    with stage(profile, "write container"):
+        body = out.tobytes()
+        chunks = [body[a:b] for a, b in zip(row_starts[:-1], row_starts[1:])]
+        return write_container(mode, w, h, block_size, chunks)
+
+# Returns the positions of the 6 level bytes of every record in a block row (records at row_offsets).
+def _lossy_level_positions(row_offsets):
+    return (row_offsets[:, None] + np.arange(6)).ravel()
+
+# Second stage for one block row of records (MODE_LOSSY_ENTROPY). Neighbouring blocks have similar
+# lo/hi levels, so each level byte is replaced by its difference (mod 256) from the same byte of
+# the previous block and the differences are stored plane by plane (all lo-R, then all lo-G, ...).
+# The masks follow unchanged, and the whole row is deflated, which run-length and Huffman codes
+# the many repeated mask bytes. Rows stay independent, like the mode-4 chunks.
+def _pack_lossy_row(row, row_offsets):
+    positions = _lossy_level_positions(row_offsets)
+    levels = row[positions].reshape(-1, 6).astype(np.int16)
+    deltas = np.diff(levels, axis=0, prepend=0).astype(np.uint8)
+    masks = np.delete(row, positions)
+    return zlib.compress(deltas.T.tobytes() + masks.tobytes(), LOSSY_ZLIB_LEVEL)
+
+# Inverts _pack_lossy_row: returns the row's records in the mode-4 layout.
+def _unpack_lossy_row(chunk, row_offsets, row_len):
+    try:
+        raw = np.frombuffer(zlib.decompress(chunk), dtype=np.uint8)
+    except zlib.error as e:
+        raise ValueError(f"Corrupt entropy-coded block row: {e}") from None
+    if len(raw) != row_len:
+        raise ValueError("Truncated lossy compressed data")
+    n = len(row_offsets)
+    levels = np.cumsum(raw[:6 * n].reshape(6, n).T, axis=0, dtype=np.uint8)
+    positions = _lossy_level_positions(row_offsets)
+    row = np.empty(row_len, dtype=np.uint8)
+    row[positions] = levels.ravel()
+    keep = np.ones(row_len, dtype=bool)
+    keep[positions] = False
+    row[keep] = raw[6 * n:]
+    return row.tobytes()
+
+# Expands an entropy-coded lossy file into the equivalent mode-4 MyImgFile (all chunk CRCs are
+# checked first, since every row is inflated).
+def _expand_lossy_entropy(f):
+    verify_chunks(f)
+    offsets, body_len = _lossy_block_offsets(f.width, f.height, f.param)
+    if len(f.chunks) != offsets.shape[0]:
+        raise ValueError("Chunk count does not match the number of block rows")
+    row_starts = offsets[:, 0].tolist() + [body_len]
+    chunks = [_unpack_lossy_row(f.chunks[by], offsets[by] - row_starts[by], row_starts[by + 1] - row_starts[by])
+              for by in range(offsets.shape[0])]
+    return f._replace(mode=MODE_LOSSY, chunks=chunks, crcs=None)
+
+# Returns the byte length of every block record (raster order) of a lossy body.
+def _lossy_record_lengths(offsets, body_len):
+    return np.diff(np.append(offsets.ravel(), body_len))
+
+# Finds the repeated block records of a lossy body. Screenshots and UI captures repeat many blocks
+# (flat backgrounds, identical widgets); each repeat can then be stored as a reference to the
+# first block with the same record. Records are compared as whole byte strings, one record length
+# (block shape) at a time. Returns which blocks (raster order) are the first with their record,
+# and every block's entry number, counting distinct records in order of first use.
+def _dedup_lossy_records(body, offsets, body_len):
+    starts = offsets.ravel()
+    lengths = _lossy_record_lengths(offsets, body_len)
+    first = np.empty(len(starts), dtype=np.int64)
+    for length in np.unique(lengths):
+        blocks = np.flatnonzero(lengths == length)
+        records = body[starts[blocks][:, None] + np.arange(length)]
+        _, first_pos, inverse = np.unique(records.view(np.dtype((np.void, int(length)))).ravel(),
+                                          return_index=True, return_inverse=True)
+        first[blocks] = blocks[first_pos[inverse.ravel()]]
+    new = first == np.arange(len(starts))
+    entry = np.cumsum(new) - 1
+    return new, entry[first]
+
+# Builds the MODE_LOSSY_DEDUP chunks, one per block row: a bit per block (set for a repeat), the
+# entry numbers of the repeated blocks as index_bytes-byte integers, then the records of the new
+# blocks. Blocks that repeat nothing cost one extra bit.
+def _pack_dedup_rows(body, offsets, body_len, new, index, index_bytes):
+    blocks_x = offsets.shape[1]
+    keep = np.repeat(new, _lossy_record_lengths(offsets, body_len))
+    row_starts = offsets[:, 0].tolist() + [body_len]
+    chunks = []
+    for by in range(offsets.shape[0]):
+        row_new = new[by * blocks_x:(by + 1) * blocks_x]
+        a, b = row_starts[by], row_starts[by + 1]
+        refs = index[by * blocks_x:(by + 1) * blocks_x][~row_new]
+        chunks.append(np.packbits(~row_new).tobytes() + refs.astype(f">u{index_bytes}").tobytes() + body[a:b][keep[a:b]].tobytes())
+    return chunks
+
+# Expands a deduplicated lossy file (see _pack_dedup_rows; the high byte of the parameter is the
+# index size) into the equivalent mode-4 MyImgFile. Rows refer to records stored in earlier rows,
+# so the whole file is expanded and all chunk CRCs are checked first.
+def _expand_lossy_dedup(f):
+    verify_chunks(f)
+    block_size, index_bytes = f.param & 0xFF, f.param >> 8
+    if block_size == 0 or index_bytes not in (2, 4):
+        raise ValueError("Invalid deduplicated lossy parameters")
+    offsets, body_len = _lossy_block_offsets(f.width, f.height, block_size)
+    blocks_y, blocks_x = offsets.shape
+    if len(f.chunks) != blocks_y:
+        raise ValueError("Chunk count does not match the number of block rows")
+    lengths = _lossy_record_lengths(offsets, body_len).reshape(blocks_y, blocks_x)
+    flag_len = (blocks_x + 7) // 8
+    repeat = np.empty((blocks_y, blocks_x), dtype=bool)
+    index = np.empty((blocks_y, blocks_x), dtype=np.int64)
+    records = []
+    for by, chunk in enumerate(f.chunks):
+        row = np.frombuffer(chunk, dtype=np.uint8)
+        repeat[by] = np.unpackbits(row[:flag_len], count=blocks_x).astype(bool)
+        n_refs = int(repeat[by].sum())
+        refs_end = flag_len + n_refs * index_bytes
+        if len(row) != refs_end + int(lengths[by][~repeat[by]].sum()):
+            raise ValueError("Truncated deduplicated block row")
+        index[by][repeat[by]] = row[flag_len:refs_end].view(f">u{index_bytes}")
+        records.append(row[refs_end:])
+    repeat, index, lengths = repeat.ravel(), index.ravel(), lengths.ravel()
+    table = np.concatenate(records) if records else np.empty(0, dtype=np.uint8)
+
+    # Entries are numbered in order of first use; a repeat must refer to an earlier entry of its own length.
+    entry_len = lengths[~repeat]
+    index[~repeat] = np.arange(len(entry_len))
+    defined = np.cumsum(~repeat) - 1
+    if np.any(index[repeat] > defined[repeat]) or not np.array_equal(entry_len[index], lengths):
+        raise ValueError("Corrupt block reference")
+    entry_start = np.cumsum(entry_len) - entry_len
+    body = table[np.repeat(entry_start[index] - offsets.ravel(), lengths) + np.arange(body_len)].tobytes()
+    row_starts = offsets[:, 0].tolist() + [body_len]
+    chunks = [body[a:b] for a, b in zip(row_starts[:-1], row_starts[1:])]
+    return f._replace(mode=MODE_LOSSY, param=block_size, chunks=chunks, crcs=None)
+
+# Collects the records of blocks [bx0, bx1) for block rows [by0, by1) into one contiguous array.
+# Returns the array and each block's record offset inside it (rows x columns). The columns of a
+# block row are contiguous inside its chunk, so only the bytes of the requested blocks are copied.
+def _lossy_band_records(f, offsets, body_len, by0, by1, bx0, bx1):
+    blocks_y, blocks_x = offsets.shape
+    parts = []
+    band_offsets = np.empty((by1 - by0, bx1 - bx0), dtype=np.int64)
+    pos = 0
+    for i, by in enumerate(range(by0, by1)):
+        row_offsets = offsets[by] - offsets[by, 0]
+        row_len = (offsets[by + 1, 0] if by + 1 < blocks_y else body_len) - offsets[by, 0]
+        chunk = f.chunks[by]
+        if len(chunk) != row_len:
+            raise ValueError("Truncated lossy compressed data")
+        start = row_offsets[bx0]
+        end = row_offsets[bx1] if bx1 < blocks_x else row_len
+        parts.append(chunk[start:end])
+        band_offsets[i] = row_offsets[bx0:bx1] - start + pos
+        pos += end - start
+    return np.frombuffer(b''.join(parts), dtype=np.uint8), band_offsets
+
+# Decodes blocks [bx0, bx1) x [by0, by1) into arr, whose top-left pixel is the top-left of block (bx0, by0).
+# Pixels are left in the mode's color space. layout is the file's (offsets, body length), if known.
+def _decode_lossy_blocks(f, arr, by0, by1, bx0, bx1, progress=None, layout=None):
+    w, h, block_size = f.width, f.height, f.param
+    offsets, body_len = layout or _lossy_block_offsets(w, h, block_size, LOSSY_RECORD_FORMATS[f.mode][1])
+    if len(f.chunks) != offsets.shape[0]:
+        raise ValueError("Chunk count does not match the number of block rows")
+    for g0, g1, bh in _lossy_row_groups(w, h, block_size):
+        r0, r1 = max(g0, by0), min(g1, by1)
+        if r0 >= r1:
+            continue
+        body, band_offsets = _lossy_band_records(f, offsets, body_len, r0, r1, bx0, bx1)
+        rows = arr[(r0 - by0) * block_size:(r0 - by0) * block_size + (r1 - r0) * bh]
+        _decode_lossy_rows(body, rows, band_offsets, bh, block_size, f.mode)
+        if progress is not None:
+            progress(int(((r1 - by0) / (by1 - by0)) * 100))
+
+# Parses data (bytes, mmap or an already-read MyImgFile) and checks that it is a BTC lossy stream;
+# entropy-coded and deduplicated files come back expanded to mode 4.
+def _open_lossy(data, verify=True):
+    f = read_container(data, verify=verify)
+    if f.mode not in BTC_MODES or f.param == 0:
+        raise ValueError(f"Not a lossy .myimg stream (mode {f.mode})")
+    if f.mode == MODE_LOSSY_ENTROPY:
+        return _expand_lossy_entropy(f)
+    if f.mode == MODE_LOSSY_DEDUP:
+        return _expand_lossy_dedup(f)
+    return f
+
+# Wraps decoded block pixels (in the mode's color space) as an RGB image.
+def _lossy_to_rgb(arr, mode, profile=None):
+    color_space = LOSSY_RECORD_FORMATS[mode][0]
+    if color_space == "RGB":
+        return Image.fromarray(arr, "RGB")
+    with stage(profile, f"{color_space.lower()} to rgb"):
+        return Image.fromarray(arr, color_space).convert("RGB")
+
+# Reconstructs the image from lossy compressed data using block-wise decoding.
+# Every record offset is known up front from the block geometry, so whole bands are decoded at once.
+def decode_lossy(data, progress=None, profile=None):
+    with stage(profile, "read container"):
+        f = _open_lossy(data)
+    blocks_y = (f.height + f.param - 1) // f.param
+    blocks_x = (f.width + f.param - 1) // f.param
+    arr = np.empty((f.height, f.width, 3), dtype=np.uint8)
+    with stage(profile, "block decode"):
+        _decode_lossy_blocks(f, arr, 0, blocks_y, 0, blocks_x, wrap_progress(profile, progress))
+    return _lossy_to_rgb(arr, f.mode, profile)
+
+# Decodes only the pixels in [x0, x1) x [y0, y1) of a lossy file (region of interest).
+# Only the blocks that intersect the box are read, CRC-checked and decoded, so latency and memory
+# scale with the box rather than the image. data may be bytes or an mmap of the file.
+def decode_region(data, x0, y0, x1, y1, progress=None):
+    f = _open_lossy(data, verify=False)
+    x0, y0 = max(0, x0), max(0, y0)
+    x1, y1 = min(f.width, x1), min(f.height, y1)
+    if x0 >= x1 or y0 >= y1:
+        raise ValueError("Region does not intersect the image")
+    block_size = f.param
+    by0, by1 = y0 // block_size, (y1 + block_size - 1) // block_size
+    bx0, bx1 = x0 // block_size, (x1 + block_size - 1) // block_size
+    verify_chunks(f, range(by0, by1))
+
+    top, left = by0 * block_size, bx0 * block_size
+    arr = np.empty((min(by1 * block_size, f.height) - top, min(bx1 * block_size, f.width) - left, 3), dtype=np.uint8)
+    _decode_lossy_blocks(f, arr, by0, by1, bx0, bx1, progress)
+    return _lossy_to_rgb(np.ascontiguousarray(arr[y0 - top:y1 - top, x0 - left:x1 - left]), f.mode)
+
+
+# Builds a one-pixel-per-block preview of a lossy file without reconstructing any pixels: each
+# block's color is its lo/hi pair weighted by how many mask bits select each level, i.e. the
+# block's mean color.
+def decode_thumbnail(data):
+    f = _open_lossy(data)
+    w, h, block_size = f.width, f.height, f.param
+    _, level_bytes, _, _, block_means = LOSSY_RECORD_FORMATS[f.mode]
+    offsets, body_len = _lossy_block_offsets(w, h, block_size, level_bytes)
+    if len(f.chunks) != offsets.shape[0]:
+        raise ValueError("Chunk count does not match the number of block rows")
+    thumb = np.empty(offsets.shape + (3,), dtype=np.uint8)
+    for by0, by1, bh in _lossy_row_groups(w, h, block_size):
+        body, band_offsets = _lossy_band_records(f, offsets, body_len, by0, by1, 0, offsets.shape[1])
+        for bx0, bx1, bw in _lossy_column_groups(w, block_size):
+            n_pixels = bh * bw
+            records = body[band_offsets[:, bx0:bx1].ravel()[:, None] + np.arange(level_bytes + (n_pixels + 7) // 8)]
+            mask_bytes = records[:, level_bytes:].copy()
+            if n_pixels % 8:
+                mask_bytes[:, -1] &= (0xFF << (8 - n_pixels % 8)) & 0xFF
+            count_hi = _POPCOUNT[mask_bytes].sum(axis=1, dtype=np.int64)[:, None]
+            colors = block_means(records, count_hi, n_pixels)
+            thumb[by0:by1, bx0:bx1] = colors.reshape(by1 - by0, bx1 - bx0, 3)
+    return _lossy_to_rgb(thumb, f.mode)
+
+
+# ===================== QUADTREE LOSSY CODEC =====================
+
+# Largest luma mean squared error a quadtree leaf may have: 0 at quality 100 (only exact
+# approximations are kept, so detail is split down to min_block), growing quadratically as quality drops.
+def quadtree_threshold(quality):
+    quality = min(100, max(0, quality))
+    return ((100 - quality) / 4) ** 2
+
+# Positions of the four children of each block at (ys, xs) of size s, in reading order.
+def _quadtree_children(ys, xs, s):
+    half = s // 2
+    return (np.repeat(ys, 4) + np.tile([0, 0, half, half], len(ys)),
+            np.repeat(xs, 4) + np.tile([0, half, 0, half], len(xs)))
+
+# Luma error of approximating each block (n, pixels) by its mean (flat) and by its two BTC levels.
+def _quadtree_errors(gray):
+    mean = gray.mean(axis=1, keepdims=True)
+    flat_error = ((gray - mean) ** 2).mean(axis=1)
+    mask = gray >= mean
+    count_hi = mask.sum(axis=1, keepdims=True)
+    sum_hi = np.where(mask, gray, 0).sum(axis=1, keepdims=True)
+    hi = sum_hi / np.maximum(count_hi, 1)
+    lo = (gray.sum(axis=1, keepdims=True) - sum_hi) / np.maximum(gray.shape[1] - count_hi, 1)
+    btc_error = ((gray - np.where(mask, hi, lo)) ** 2).mean(axis=1)
+    return flat_error, btc_error
+
+# Encodes one band of max_block rows (width a multiple of max_block) into (flags, records).
+# The tree is walked level by level, so all blocks of one size are handled in one vectorized step.
+# Each block becomes the cheapest leaf whose luma error stays within threshold: one flat color
+# (3 bytes), else a BTC record as in mode 4; blocks that fit neither are split into quadrants
+# (min_block blocks always become BTC leaves). Per level, the flag bit stream holds one split bit
+# per block larger than min_block followed by one flat bit per leaf; the records hold the flat
+# colors followed by the BTC records, all in reading order of the parents.
+def _encode_quadtree_band(band, max_block, min_block, threshold):
+    h, w, _ = band.shape
+    luma = 0.2989 * band[..., 0] + 0.587 * band[..., 1] + 0.114 * band[..., 2]
+    ys = np.zeros(w // max_block, dtype=np.int64)
+    xs = np.arange(w // max_block, dtype=np.int64) * max_block
+    flags, records = [], []
+    s = max_block
+    while len(ys):
+        gy, gx = ys // s, xs // s
+        gray = luma.reshape(h // s, s, w // s, s)[gy, :, gx, :].reshape(len(ys), -1)
+        flat_error, btc_error = _quadtree_errors(gray)
+        flat = flat_error <= threshold
+        split = ~flat & (btc_error > threshold) if s > min_block else np.zeros(len(ys), dtype=bool)
+        if s > min_block:
+            flags.append(split)
+        leaves = ~split
+        flags.append(flat[leaves])
+        pixels = band.reshape(h // s, s, w // s, s, 3)[gy, :, gx, :, :].reshape(len(ys), s * s, 3)
+        flat_pixels = pixels[flat].astype(np.float32)
+        records.append((flat_pixels.sum(axis=1).astype(np.int64) // (s * s)).astype(np.uint8).ravel())
+        records.append(_btc_block_records(pixels[leaves & ~flat].transpose(0, 2, 1)).ravel())
+        ys, xs = _quadtree_children(ys[split], xs[split], s)
+        s //= 2
+    return np.packbits(np.concatenate(flags)).tobytes(), np.concatenate(records).tobytes()
+
+# Decodes one band from its flags and records into band (max_block rows, padded width).
+def _decode_quadtree_band(band, flag_bytes, record_bytes, max_block, min_block):
+    h, w, _ = band.shape
+    bits = np.unpackbits(np.frombuffer(flag_bytes, dtype=np.uint8)).astype(bool)
+    records = np.frombuffer(record_bytes, dtype=np.uint8)
+    ys = np.zeros(w // max_block, dtype=np.int64)
+    xs = np.arange(w // max_block, dtype=np.int64) * max_block
+    bit_pos = rec_pos = 0
+
+    # Returns the next count flag bits / the next count records of length size.
+    def take_bits(count):
+        nonlocal bit_pos
+        if bit_pos + count > len(bits):
+            raise ValueError("Truncated quadtree flags")
+        bit_pos += count
+        return bits[bit_pos - count:bit_pos]
+    def take_records(count, size):
+        nonlocal rec_pos
+        if rec_pos + count * size > len(records):
+            raise ValueError("Truncated quadtree block records")
+        rec_pos += count * size
+        return records[rec_pos - count * size:rec_pos].reshape(count, size)
+
+    s = max_block
+    while len(ys):
+        split = take_bits(len(ys)) if s > min_block else np.zeros(len(ys), dtype=bool)
+        leaf_ys, leaf_xs = ys[~split], xs[~split]
+        flat = take_bits(len(leaf_ys))
+        grid = band.reshape(h // s, s, w // s, s, 3)
+        colors = take_records(int(flat.sum()), 3)
+        grid[leaf_ys[flat] // s, :, leaf_xs[flat] // s, :, :] = colors[:, None, None, :]
+        btc = take_records(int((~flat).sum()), 6 + s * s // 8)
+        mask = np.unpackbits(btc[:, 6:], axis=1).astype(bool)
+        pixels = np.where(mask[:, :, None], btc[:, None, 3:6], btc[:, None, 0:3])
+        grid[leaf_ys[~flat] // s, :, leaf_xs[~flat] // s, :, :] = pixels.reshape(-1, s, s, 3)
+        ys, xs = _quadtree_children(ys[split], xs[split], s)
+        s //= 2
+    if rec_pos != len(records) or len(flag_bytes) != (bit_pos + 7) // 8:
+        raise ValueError("Quadtree band has trailing data")
+
+# Lossy compression with adaptive block sizes: the image is covered by max_block tiles that are
+# split into quadrants until each block fits as one flat color or one 2-color BTC block within the
+# error allowed by quality, down to min_block. Flat sky or background stays one 3-byte tile while
+# detailed areas get small blocks, so quality trades directly against file size (and encode time,
+# which grows with the number of levels visited). The image is padded to whole tiles by repeating
+# its edge pixels.
+# Chunks: split flags and leaf records for each row of tiles. The parameter packs both block sizes.
+def encode_lossy_quadtree(img, quality=QUADTREE_QUALITY, max_block=QUADTREE_MAX_BLOCK,
+                          min_block=QUADTREE_MIN_BLOCK, progress=None, profile=None):
+    if not (4 <= min_block <= max_block <= 255) or max_block & (max_block - 1) or min_block & (min_block - 1):
+        raise ValueError("Quadtree block sizes must be powers of two between 4 and 128")
+    progress = wrap_progress(profile, progress)
+    with stage(profile, "rgb convert"):
+        arr = np.asarray(img.convert("RGB"))
+    h, w, _ = arr.shape
+    tiles_y, tiles_x = -(-h // max_block), -(-w // max_block)
+    threshold = quadtree_threshold(quality)
+    chunks = []
+    with stage(profile, "quadtree encode"):
+        for ty in range(tiles_y):
+            rows = arr[ty * max_block:(ty + 1) * max_block]
+            band = np.pad(rows, ((0, max_block - len(rows)), (0, tiles_x * max_block - w), (0, 0)), mode="edge")
+            chunks.extend(_encode_quadtree_band(band, max_block, min_block, threshold))
+            if progress is not None:
+                progress(int(((ty + 1) / tiles_y) * 100))
+    with stage(profile, "write container"):
+        return write_container(MODE_LOSSY_QUADTREE, w, h, (max_block << 8) | min_block, chunks)
+
+# Checks a quadtree file's parameters and chunk count; returns (max_block, min_block).
+def _quadtree_blocks(f):
+    max_block, min_block = f.param >> 8, f.param & 0xFF
+    if f.mode != MODE_LOSSY_QUADTREE or not (4 <= min_block <= max_block):
+        raise ValueError(f"Not a quadtree lossy .myimg stream (mode {f.mode})")
+    if len(f.chunks) != 2 * (-(-f.height // max_block)):
+        raise ValueError("Chunk count does not match the number of tile rows")
+    return max_block, min_block
+
+# Decodes a quadtree file as (y0, rows) bands, one row of tiles each.
+def _iter_quadtree(f, max_block, min_block, progress=None, profile=None):
+    tiles_y, tiles_x = -(-f.height // max_block), -(-f.width // max_block)
+    band = np.empty((max_block, tiles_x * max_block, 3), dtype=np.uint8)
+    for ty in range(tiles_y):
+        with stage(profile, "quadtree decode"):
+            _decode_quadtree_band(band, f.chunks[2 * ty], f.chunks[2 * ty + 1], max_block, min_block)
+            rows = band[:min(max_block, f.height - ty * max_block), :f.width].copy()
+        if progress is not None:
+            progress(int(((ty + 1) / tiles_y) * 100))
+        yield ty * max_block, rows
+
+# Reconstructs a quadtree lossy image, one row of tiles at a time.
+def decode_lossy_quadtree(data, progress=None, profile=None):
+    with stage(profile, "read container"):
+        f = read_container(data)
+    max_block, min_block = _quadtree_blocks(f)
+    arr = np.empty((f.height, f.width, 3), dtype=np.uint8)
+    for y0, rows in _iter_quadtree(f, max_block, min_block, wrap_progress(profile, progress), profile):
+        arr[y0:y0 + len(rows)] = rows
+    return Image.fromarray(arr, "RGB")
+
+
+# ===================== STREAMING DECODE =====================
+
+# Maps a file read-only into memory. Passed to the decoders, only the pages they touch are read,
+# so a file larger than RAM costs address space rather than memory.
+@contextmanager
+def map_file(path):
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield mm
+    finally:
+        try:
+            mm.close()
+        except BufferError:
+            pass  # chunk views are still referenced (e.g. by a traceback); the map closes with them
+
+# Palette modes: the LZW stream has no restart points, but the decoder keeps its state between
+# slices of codes, so the code stream is unpacked a slice at a time and decoded a few codes at a
+# time, and each band of indices is expanded to RGB as soon as it is complete.
+def _iter_lossless_lzw(f, band_rows, progress=None):
+    if len(f.chunks) != 2:
+        raise ValueError(f"Unsupported lossless mode: {f.mode}")
+    clear, _, _, iter_codes = LOSSLESS_CODE_FORMATS[f.mode]
+    palette = np.frombuffer(f.chunks[0], dtype=np.uint8).reshape(256, 3)
+    decoder = lzw.LZWDecoder(f.width * f.height, clear)
+    band_size = band_rows * f.width
+    indices = bytearray()
+    y0 = 0
+    for codes in iter_codes(f.chunks[1]):
+        codes = codes.tolist()
+        for start in range(0, len(codes), lzw.STREAM_DECODE_CODES):
+            decoder.feed(codes[start:start + lzw.STREAM_DECODE_CODES], indices)
+            while len(indices) >= band_size:
+                rows = palette[np.frombuffer(indices, dtype=np.uint8, count=band_size).reshape(band_rows, f.width)]
+                del indices[:band_size]
+                y0 += band_rows
+                if progress is not None:
+                    progress(int((y0 / f.height) * 100))
+                yield y0 - band_rows, rows
+    decoder.finish()
+    if indices:
+        rows = palette[np.frombuffer(indices, dtype=np.uint8).reshape(-1, f.width)]
+        del indices[:]
+        if progress is not None:
+            progress(100)
+        yield y0, rows
+
+# Strip mode: strips are decoded one after another and cut into bands.
+def _iter_lossless_strips(f, band_rows, progress=None):
+    strip_rows = f.param
+    if strip_rows == 0 or len(f.chunks) != 1 + (f.height + strip_rows - 1) // strip_rows:
+        raise ValueError("Strip table does not match image height")
+    palette = np.frombuffer(f.chunks[0], dtype=np.uint8).reshape(256, 3)
+    for i, chunk in enumerate(f.chunks[1:]):
+        y0 = i * strip_rows
+        rows = min(strip_rows, f.height - y0)
+        arr = np.frombuffer(_decode_strip(chunk, rows * f.width), dtype=np.uint8).reshape(rows, f.width)
+        for y in range(0, rows, band_rows):
+            yield y0 + y, palette[arr[y:y + band_rows]]
+        if progress is not None:
+            progress(int(((y0 + rows) / f.height) * 100))
+
+# BTC block modes: whole block rows are decoded per band.
+def _iter_lossy(f, band_rows, progress=None):
+    f = _open_lossy(f)
+    block_size = f.param
+    layout = _lossy_block_offsets(f.width, f.height, block_size, LOSSY_RECORD_FORMATS[f.mode][1])
+    blocks_y, blocks_x = layout[0].shape
+    step = max(1, band_rows // block_size)
+    for by0 in range(0, blocks_y, step):
+        by1 = min(by0 + step, blocks_y)
+        rows = np.empty((min(by1 * block_size, f.height) - by0 * block_size, f.width, 3), dtype=np.uint8)
+        _decode_lossy_blocks(f, rows, by0, by1, 0, blocks_x, layout=layout)
+        if progress is not None:
+            progress(int((by1 / blocks_y) * 100))
+        if LOSSY_RECORD_FORMATS[f.mode][0] != "RGB":
+            rows = np.asarray(_lossy_to_rgb(rows, f.mode))
+        yield by0 * block_size, rows
+
+# Decodes any .myimg stream as a sequence of (y0, rows) bands from top to bottom, where rows is an
+# (n, width, 3) uint8 RGB array. Bands hold about band_pixels pixels (whole block or tile rows in
+# the lossy modes, so they can be larger), and only one band of output is alive at a time. With
+# data an mmap of the file (see map_file), an image can be written out band by band (see
+# decode_to_file) without the whole file or image in memory. The working set beyond the band is
+# a band of indices and a slice of codes in palette modes 0-2, and the expanded block records in
+# the entropy-coded and deduplicated lossy modes. Every chunk CRC is checked before the first band.
+def iter_decode(data, band_pixels=STREAM_BAND_PIXELS, progress=None):
+    f = read_container(data)
+    band_rows = max(1, band_pixels // max(1, f.width))
+    if f.mode in LOSSLESS_CODE_FORMATS:
+        return _iter_lossless_lzw(f, band_rows, progress)
+    if f.mode == MODE_LOSSLESS_STRIPS:
+        return _iter_lossless_strips(f, band_rows, progress)
+    if f.mode == MODE_LOSSLESS_RGB:
+        return _iter_lossless_rgb(f, _lossless_rgb_types(f), band_rows, progress)
+    if f.mode == MODE_LOSSY_QUADTREE:
+        return _iter_quadtree(f, *_quadtree_blocks(f), progress)
+    return _iter_lossy(f, band_rows, progress)
+
+# Writes RGB bands (as yielded by iter_decode) to a PNG file as they arrive. Rows get the same
+# adaptive PNG filters as the true-color mode and are deflated into one IDAT chunk per band. Rows
+# are filtered a few at a time, so the filter temporaries stay small next to the band itself.
+def write_png_bands(path, width, height, bands, level=RGB_ZLIB_LEVEL):
+    def write_chunk(out, kind, payload):
+        out.write(struct.pack(">I", len(payload)) + kind + payload)
+        out.write(struct.pack(">I", zlib.crc32(payload, zlib.crc32(kind))))
+
+    filter_rows = max(1, PNG_FILTER_PIXELS // max(1, width))
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 15, 9, zlib.Z_FILTERED)
+    prev = np.zeros((width, 3), dtype=np.uint8)
+    with open(path, "wb") as out:
+        out.write(b"\x89PNG\r\n\x1a\n")
+        write_chunk(out, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        for _, band in bands:
+            parts = []
+            for y in range(0, len(band), filter_rows):
+                rows = band[y:y + filter_rows]
+                types, residuals = _filter_rgb_band(rows, prev)
+                lines = np.empty((len(rows), 1 + width * 3), dtype=np.uint8)
+                lines[:, 0] = types
+                lines[:, 1:] = residuals.reshape(len(rows), -1)
+                parts.append(compressor.compress(lines.tobytes()))
+                prev = rows[-1]
+            payload = b"".join(parts)
+            if payload:
+                write_chunk(out, b"IDAT", payload)
+        write_chunk(out, b"IDAT", compressor.flush())
+        write_chunk(out, b"IEND", b"")
+
+# Decodes data band by band straight into an image file: PNG for a .png path, otherwise raw
+# 8-bit RGB rows. Returns (width, height). Pair with map_file to decode files larger than RAM:
+#
+#   with myimg_codec.map_file("huge.myimg") as mm:
+#       myimg_codec.decode_to_file(mm, "huge.png")
+def decode_to_file(data, path, band_pixels=STREAM_BAND_PIXELS, progress=None):
+    f = read_container(data)
+    bands = iter_decode(f, band_pixels, progress)
+    if path.lower().endswith(".png"):
+        write_png_bands(path, f.width, f.height, bands)
+    else:
+        with open(path, "wb") as out:
+            for _, band in bands:
+                out.write(band.tobytes())
+    return f.width, f.height
+
+
+# ===================== GENERIC ENTRY POINTS =====================
+
+# Compresses an image with the given mode name ("lossless", "lossless-parallel", "lossless-rgb", "lossy",
+# "lossy-entropy", "lossy-ycbcr", "lossy-dedup" or "lossy-quadtree"). quality only applies to the quadtree mode.
+def encode(img, mode="lossless", block_size=LOSSY_BLOCK_SIZE, workers=None, progress=None, profile=None,
+           quality=QUADTREE_QUALITY):
+    if mode == "lossless":
+        return encode_lossless(img, progress=progress, profile=profile)
+    if mode == "lossless-parallel":
+        return encode_lossless_strips(img, workers=workers, progress=progress, profile=profile)
+    if mode == "lossless-rgb":
+        return encode_lossless_rgb(img, progress=progress, profile=profile)
+    if mode == "lossy":
+        return encode_lossy(img, block_size=block_size, progress=progress, profile=profile)
+    if mode == "lossy-entropy":
+        return encode_lossy(img, block_size=block_size, entropy=True, progress=progress, profile=profile)
+    if mode == "lossy-ycbcr":
+        return encode_lossy(img, block_size=block_size, ycbcr=True, progress=progress, profile=profile)
+    if mode == "lossy-dedup":
+        return encode_lossy(img, block_size=block_size, dedup=True, progress=progress, profile=profile)
+    if mode == "lossy-quadtree":
+        return encode_lossy_quadtree(img, quality=quality, progress=progress, profile=profile)
+    raise ValueError(f"Unknown compression mode: {mode}")
+
+# Decompresses any .myimg stream, picking the decoder from its mode. The container (and, for v2,
+# every chunk CRC) is validated before decoding starts.
+def decode(data, workers=None, progress=None, profile=None):
+    with stage(profile, "read container"):
+        f = read_container(data)
+    if f.mode in LOSSLESS_MODES:
+        return decode_lossless(f, workers=workers, progress=progress, profile=profile)
+    if f.mode == MODE_LOSSY_QUADTREE:
+        return decode_lossy_quadtree(f, progress=progress, profile=profile)
+    return decode_lossy(f, progress=progress, profile=profile)
@@ -0,0 +1,84 @@
+from collections import namedtuple
+import numpy as np
+
+# Color effects for the GUI's Edit menu. Every effect is an affine color transform (a 3x3
+# matrix plus an offset, applied to each RGB pixel) or a per-channel 256-entry lookup table. A
+# chain of effects is planned into as few steps as possible: consecutive matrices are multiplied
+# into one and consecutive tables merged into one, and a matrix that treats each channel on its
+# own (such as Invert) becomes a table. Each remaining step is one pass of Pillow's C code over
+# the image, row by row in float32 for matrices (Image.convert with a matrix) and by table
+# lookup otherwise (Image.point), so no full-size float temporaries are ever built and only the
+# input and output images are in memory.
+#
+#   img = apply_effects(img, [SEPIA, INVERT, GRAYSCALE])
+
+# matrix (3x3) and offset (3) for affine effects, or lut (3x256 uint8, one table per channel).
+Effect = namedtuple("Effect", "name matrix offset lut")
+
+# An affine effect: out = matrix @ rgb + offset, rounded and clipped to 0-255.
+def matrix_effect(name, matrix, offset=(0, 0, 0)):
+    return Effect(name, np.asarray(matrix, dtype=np.float64), np.asarray(offset, dtype=np.float64), None)
+
+# A lookup-table effect: lut is one 256-entry table shared by all channels, or one per channel.
+def lut_effect(name, lut):
+    lut = np.broadcast_to(np.asarray(lut, dtype=np.uint8), (3, 256))
+    return Effect(name, None, None, np.ascontiguousarray(lut))
+
+# ITU-R 601 luma, the weights PIL uses for convert("L").
+GRAYSCALE = matrix_effect("Grayscale", [[0.299, 0.587, 0.114]] * 3)
+INVERT = matrix_effect("Invert", -np.eye(3), (255, 255, 255))
+SEPIA = matrix_effect("Sepia", [[0.393, 0.769, 0.189],
+                                [0.349, 0.686, 0.168],
+                                [0.272, 0.534, 0.131]])
+
+# Whether an affine transform maps every RGB color into 0-255, i.e. whether clipping after it
+# can be skipped. An affine map takes its extremes on the corners of the RGB cube.
+def _stays_in_range(matrix, offset):
+    corners = np.array([[r, g, b] for r in (0, 255) for g in (0, 255) for b in (0, 255)], dtype=np.float64)
+    mapped = corners @ matrix.T + offset
+    return mapped.min() >= -0.5 and mapped.max() < 255.5
+
+# Appends a table step, merging it into a table step right before it.
+def _append_lut(steps, lut):
+    if steps and steps[-1][0] == "lut":
+        lut = np.take_along_axis(lut, steps[-1][1].astype(np.intp), axis=1)
+        steps.pop()
+    steps.append(("lut", lut))
+
+# Plans a chain of effects into steps ("affine", matrix, offset) and ("lut", table). Matrices
+# are composed while the result so far never needs clipping, so the composed step gives what
+# applying the effects one by one would, up to rounding (a clipped intermediate starts a new
+# step instead). Diagonal matrices are turned into tables, and tables are composed into one.
+def plan_effects(effects):
+    steps = []
+    for effect in effects:
+        last = steps[-1] if steps else None
+        if effect.lut is not None:
+            steps.append(("lut", effect.lut))
+        elif last is not None and last[0] == "affine" and _stays_in_range(last[1], last[2]):
+            steps[-1] = ("affine", effect.matrix @ last[1], effect.matrix @ last[2] + effect.offset)
+        else:
+            steps.append(("affine", effect.matrix, effect.offset))
+    planned = []
+    for step in steps:
+        if step[0] == "affine" and not np.any(step[1] - np.diag(np.diag(step[1]))):
+            levels = np.arange(256, dtype=np.float64)
+            lut = np.clip(np.rint(np.diag(step[1])[:, None] * levels + step[2][:, None]), 0, 255).astype(np.uint8)
+            _append_lut(planned, lut)
+        elif step[0] == "lut":
+            _append_lut(planned, step[1])
+        else:
+            planned.append(step)
+    return planned
+
+# Returns a new RGB image with the chain of effects applied in order (img itself if there are none).
+def apply_effects(img, effects):
+    if not effects:
+        return img
+    out = img if img.mode == "RGB" else img.convert("RGB")
+    for step in plan_effects(effects):
+        if step[0] == "lut":
+            out = out.point(step[1].reshape(-1).tolist())
+        else:
+            out = out.convert("RGB", tuple(np.column_stack((step[1], step[2])).ravel().tolist()))
+    return out
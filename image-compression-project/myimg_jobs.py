@@ -0,0 +1,270 @@
+import os
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import myimg_codec
+from myimg_cli import compress_file, decompress_file, output_path
+
+# Job scheduler behind the GUI: compress/decompress jobs over any number of files run on a
+# bounded pool of workers, each with its own progress, cancellation token and result. Workers
+# are threads by default, which suits jobs on in-memory images; with processes=True they are
+# processes, so the pure-Python LZW loops of several jobs really run in parallel and leave the
+# GUI thread's share of the GIL alone (functions and arguments must then be picklable).
+# Cancellation is cooperative: a job's progress callback, which the codecs call between steps
+# of their loops, raises JobCancelled once the job is cancelled. Never imports tkinter; the GUI
+# polls the job states and progress at its own frame rate (on_done can hand over to the Tk thread).
+#
+#   queue = JobQueue(workers=4, processes=True)
+#   jobs = [queue.submit_compress(p, "lossy") for p in paths]
+#   queue.cancel(jobs[0])
+#   print([(job.name, job.state, job.progress) for job in queue.jobs])
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+# Jobs of a process queue that can be unfinished at once (see _JobSlots).
+PROCESS_JOB_SLOTS = 4096
+
+# Raised inside a cancelled job to unwind out of the codec.
+class JobCancelled(Exception):
+    pass
+
+# Cooperative cancellation flag, set from any thread and checked by the running job. For a job
+# in a worker process the flag is also set in the queue's shared slot arrays.
+class CancelToken:
+    def __init__(self, slots=None, slot=None):
+        self._event = threading.Event()
+        self._slots = slots
+        self._slot = slot
+
+    def cancel(self):
+        self._event.set()
+        if self._slots is not None:
+            self._slots.cancelled[self._slot] = 1
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    # Raises JobCancelled if the token has been cancelled.
+    def check(self):
+        if self._event.is_set():
+            raise JobCancelled()
+
+# Per-job progress and cancel flags shared with worker processes: two lock-free byte arrays in
+# shared memory, handed to the workers when they start (synchronized objects cannot be passed
+# with each task). Each unfinished job owns one slot; progress is -1 until the job starts.
+class _JobSlots:
+    def __init__(self, context, size=PROCESS_JOB_SLOTS):
+        self.progress = context.RawArray("b", size)
+        self.cancelled = context.RawArray("b", size)
+        self._free = list(range(size - 1, -1, -1))
+        self._lock = threading.Lock()
+
+    def take(self):
+        with self._lock:
+            if not self._free:
+                raise ValueError("Too many unfinished jobs")
+            slot = self._free.pop()
+        self.progress[slot] = -1
+        self.cancelled[slot] = 0
+        return slot
+
+    def release(self, slot):
+        with self._lock:
+            self._free.append(slot)
+
+# Slot arrays of the queue that started this worker process.
+_worker_slots = None
+
+def _init_worker(progress, cancelled):
+    global _worker_slots
+    _worker_slots = (progress, cancelled)
+
+# Worker process: runs one job with a progress callback that publishes to its slot and raises
+# JobCancelled once the slot's cancel flag is set.
+def _run_in_process(slot, func, args, kwargs):
+    progress, cancelled = _worker_slots
+    def report(value):
+        if cancelled[slot]:
+            raise JobCancelled()
+        progress[slot] = value
+    report(0)
+    return func(*args, progress=report, **kwargs)
+
+# One queued operation. state, progress (0-100), result and error are written by the worker
+# thread and can be read from any thread. progress is the job's shared progress counter: a plain
+# attribute store (atomic under the GIL), so reporting takes no lock and schedules nothing, and
+# a reader polling it only ever sees the latest value, however often the codec reports. For a job
+# in a worker process, state and progress read the job's shared slot until it has finished.
+class Job:
+    def __init__(self, job_id, name, kind=None, path=None, output=None, on_done=None, slots=None, slot=None):
+        self.id = job_id
+        self.name = name
+        self.kind = kind
+        self.path = path
+        self.output = output
+        self._state = QUEUED
+        self._progress = 0
+        self.result = None
+        self.error = None
+        self.token = CancelToken(slots, slot)
+        self.future = None
+        self.on_done = on_done
+        self._slots = slots
+        self.slot = slot
+
+    @property
+    def state(self):
+        if self._state == QUEUED and self._slots is not None and self._slots.progress[self.slot] >= 0:
+            return RUNNING
+        return self._state
+
+    @state.setter
+    def state(self, value):
+        self._state = value
+
+    @property
+    def progress(self):
+        if self._slots is not None and self._state not in FINISHED_STATES:
+            return max(0, self._slots.progress[self.slot])
+        return self._progress
+
+    @progress.setter
+    def progress(self, value):
+        self._progress = value
+
+    @property
+    def finished(self):
+        return self.state in FINISHED_STATES
+
+    # Progress callback handed to the codec: aborts the codec if the job was cancelled, otherwise
+    # publishes the percentage.
+    def report(self, value):
+        self.token.check()
+        self.progress = value
+
+class JobQueue:
+    # workers bounds how many jobs run at once (default: up to 4, one per core); the rest wait in
+    # order. With processes, jobs run in worker processes (started with spawn, so forking a
+    # process that runs a GUI is never needed).
+    def __init__(self, workers=None, processes=False):
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self._slots = None
+        if processes:
+            context = multiprocessing.get_context("spawn")
+            self._slots = _JobSlots(context)
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_init_worker,
+                                             initargs=(self._slots.progress, self._slots.cancelled))
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="myimg-job")
+        self._ids = itertools.count(1)
+        self.jobs = []
+
+    # Queues func(*args, progress=job.report, **kwargs) and returns its Job. on_done(job) is called
+    # from the worker thread once the job has finished, failed or been cancelled. output is the
+    # file the job writes, if any: a job is rejected with ValueError if an unfinished job already
+    # writes that file, or if the file exists and overwrite is False (decoding next to the input
+    # would otherwise replace e.g. photos/a.png by the decode of photos/a.myimg).
+    def submit(self, name, func, *args, kind=None, path=None, output=None, overwrite=False, on_done=None, **kwargs):
+        if output is not None:
+            if not overwrite and os.path.exists(output):
+                raise ValueError(f"{output} already exists")
+            key = os.path.normcase(os.path.abspath(output))
+            for other in self.jobs:
+                if not other.finished and other.output is not None and os.path.normcase(os.path.abspath(other.output)) == key:
+                    raise ValueError(f"{output} is already the output of queued job {other.name}")
+        if self._slots is None:
+            job = Job(next(self._ids), name, kind, path, output, on_done)
+            job.future = self._pool.submit(self._run, job, func, args, kwargs)
+        else:
+            slot = self._slots.take()
+            job = Job(next(self._ids), name, kind, path, output, on_done, self._slots, slot)
+            job.future = self._pool.submit(_run_in_process, slot, func, args, kwargs)
+            job.future.add_done_callback(lambda future, job=job: self._finish_process_job(job, future))
+        self.jobs.append(job)
+        return job
+
+    # Records the outcome of a job that ran in a worker process (or was cancelled before it
+    # started), keeping its last reported progress, and frees its slot.
+    def _finish_process_job(self, job, future):
+        job.progress = max(0, self._slots.progress[job.slot])
+        if future.cancelled():
+            job.state = CANCELLED
+        elif future.exception() is None:
+            job.result = future.result()
+            job.progress = 100
+            job.state = DONE
+        elif isinstance(future.exception(), JobCancelled):
+            job.state = CANCELLED
+        else:
+            job.error = future.exception()
+            job.state = FAILED
+        self._slots.release(job.slot)
+        if job.on_done is not None:
+            job.on_done(job)
+
+    # Worker: runs one job and records its outcome.
+    def _run(self, job, func, args, kwargs):
+        if job.token.cancelled:
+            job.state = CANCELLED
+        else:
+            job.state = RUNNING
+            try:
+                job.result = func(*args, progress=job.report, **kwargs)
+                job.progress = 100
+                job.state = DONE
+            except JobCancelled:
+                job.state = CANCELLED
+            except Exception as e:
+                job.error = e
+                job.state = FAILED
+        if job.on_done is not None:
+            job.on_done(job)
+        return job
+
+    # Queues the compression of an image file to .myimg (next to it, or in out_dir).
+    def submit_compress(self, path, mode="lossless", out_dir=None, block_size=myimg_codec.LOSSY_BLOCK_SIZE,
+                        quality=myimg_codec.QUADTREE_QUALITY, overwrite=False, on_done=None):
+        out_path = output_path(path, ".myimg", out_dir)
+        return self.submit(os.path.basename(path), compress_file, path, out_path, mode, block_size, quality,
+                           kind="compress", path=path, output=out_path, overwrite=overwrite, on_done=on_done)
+
+    # Queues the decompression of a .myimg file to PNG (next to it, or in out_dir).
+    def submit_decompress(self, path, out_dir=None, overwrite=False, on_done=None):
+        out_path = output_path(path, ".png", out_dir)
+        return self.submit(os.path.basename(path), decompress_file, path, out_path,
+                           kind="decompress", path=path, output=out_path, overwrite=overwrite, on_done=on_done)
+
+    # Cancels a job: a queued job never starts, a running one stops at its next progress report.
+    def cancel(self, job):
+        job.token.cancel()
+        if job.future is not None and job.future.cancel() and self._slots is None:
+            job.state = CANCELLED
+            if job.on_done is not None:
+                job.on_done(job)
+
+    def cancel_all(self):
+        for job in self.jobs:
+            if not job.finished:
+                self.cancel(job)
+
+    # Forgets finished jobs and returns how many were removed.
+    def clear_finished(self):
+        before = len(self.jobs)
+        self.jobs = [job for job in self.jobs if not job.finished]
+        return before - len(self.jobs)
+
+    # Number of jobs per state.
+    def counts(self):
+        counts = dict.fromkeys((QUEUED, RUNNING) + FINISHED_STATES, 0)
+        for job in self.jobs:
+            counts[job.state] += 1
+        return counts
+
+    # Stops accepting jobs; with cancel, queued and running jobs are cancelled as well.
+    def shutdown(self, cancel=True, wait=False):
+        if cancel:
+            self.cancel_all()
+        self._pool.shutdown(wait=wait, cancel_futures=cancel)
@@ -0,0 +1,111 @@
+import os
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+# Image loading for the GUI's previews, kept free of tkinter like the codec. Previews are decoded
+# at reduced size: JPEGs through Image.draft, which makes the decoder itself scale by 1/2, 1/4 or
+# 1/8 (decoding far fewer pixels), and other formats through Image.reduce before the final
+# resize. Each file's previews are kept as a small pyramid of sizes in an LRU cache, so showing
+# the same file again, or at a smaller size, needs no decoding at all.
+#
+#   cache = PreviewCache()
+#   thumb = cache.get("photo.jpg", (330, 330))
+
+# Files whose previews are kept, and preview sizes kept per file.
+PREVIEW_CACHE_FILES = 16
+PREVIEW_CACHE_LEVELS = 4
+
+# Size of img scaled down (never up) to fit in size, keeping the aspect ratio.
+def fit_size(img_size, size):
+    w, h = img_size
+    scale = min(size[0] / w, size[1] / h, 1)
+    return max(1, round(w * scale)), max(1, round(h * scale))
+
+# Returns img as an RGB image that fits in size, reusing img itself when it already does.
+# Large images are shrunk with Image.reduce first, so no full-size copy is made. Palette and
+# bilevel images are the exception: Pillow resizes those with NEAREST, which aliases fine
+# detail, so they are converted to RGB first.
+def make_preview(img, size):
+    target = fit_size(img.size, size)
+    if img.mode in ("P", "1") and target != img.size:
+        img = img.convert("RGB")
+    if target != img.size:
+        img = img.resize(target, Image.Resampling.BICUBIC, reducing_gap=2.0)
+    return img if img.mode == "RGB" else img.convert("RGB")
+
+# Decodes the image file at path straight to a preview that fits in size and returns it with
+# the file's full image size. JPEG files are decoded at the smallest DCT scale that is still at
+# least the preview size; palette images are converted before shrinking (see make_preview); an
+# RGB image that already fits is returned as decoded, loaded before its file is closed.
+def open_preview(path, size):
+    with Image.open(path) as img:
+        full_size = img.size
+        if img.format == "JPEG":
+            img.draft("RGB", fit_size(full_size, size))
+        preview = make_preview(img, size)
+        preview.load()
+    return preview, full_size
+
+# LRU cache of previews per file. A file's entry is keyed by its path, size on disk and
+# modification time, so an edited file is decoded again. A request is answered from the smallest
+# cached preview of that file that is at least as large (downscaling it if needed); only when
+# there is none is the file decoded.
+class PreviewCache:
+    def __init__(self, max_files=PREVIEW_CACHE_FILES, max_levels=PREVIEW_CACHE_LEVELS):
+        self.max_files = max_files
+        self.max_levels = max_levels
+        self._files = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # Returns an RGB preview of the image file at path that fits in size.
+    def get(self, path, size):
+        st = os.stat(path)
+        key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+        source = None
+        with self._lock:
+            levels = self._files.get(key)
+            if levels is not None:
+                self._files.move_to_end(key)
+                full_size = levels.full_size
+                source = self._smallest_covering(levels, size)
+                if source is not None and source.size == fit_size(full_size, size):
+                    levels.move_to_end(source.size)
+                    self.hits += 1
+                    return source
+        if source is not None:
+            self.hits += 1
+            preview = make_preview(source, size)
+        else:
+            self.misses += 1
+            preview, full_size = open_preview(path, size)
+        with self._lock:
+            levels = self._files.get(key)
+            if levels is None:
+                levels = self._files[key] = _Levels(full_size)
+            self._files.move_to_end(key)
+            levels[preview.size] = preview
+            while len(levels) > self.max_levels:
+                levels.popitem(last=False)
+            while len(self._files) > self.max_files:
+                self._files.popitem(last=False)
+        return preview
+
+    # Smallest cached preview that can be scaled down to the preview for size, or None.
+    @staticmethod
+    def _smallest_covering(levels, size):
+        target = fit_size(levels.full_size, size)
+        covering = [img for img in levels.values() if img.width >= target[0] and img.height >= target[1]]
+        return min(covering, key=lambda img: img.width * img.height, default=None)
+
+    def clear(self):
+        with self._lock:
+            self._files.clear()
+
+# One file's cached previews by pixel size, oldest first, with the file's full image size.
+class _Levels(OrderedDict):
+    def __init__(self, full_size):
+        super().__init__()
+        self.full_size = full_size
@@ -0,0 +1,125 @@
+import time
+import logging
+import tracemalloc
+from collections import namedtuple
+from contextlib import contextmanager, nullcontext
+
+# Opt-in per-stage profiling for the .myimg codecs. Pass a StageProfile as profile= to any
+# encoder/decoder in myimg_codec and it records wall time and tracemalloc peak for each stage
+# (palette conversion, LZW loop, code packing, container I/O, ...). Without a profile every
+# stage is a no-op context, so normal runs pay nothing.
+#
+#   profile = StageProfile()
+#   data = myimg_codec.encode(img, "lossless", profile=profile)
+#   print("\n".join(profile.format_lines()))
+
+logger = logging.getLogger("myimg.profile")
+
+# name, total wall seconds, extra bytes allocated at the peak (None when memory is not traced),
+# and how many times the stage ran.
+StageRecord = namedtuple("StageRecord", "name seconds peak_bytes calls")
+
+class StageProfile:
+    # memory=False skips tracemalloc: timings are then not slowed down by tracing (tracing makes
+    # the pure-Python LZW loops several times slower), but no peaks are recorded.
+    def __init__(self, memory=True):
+        self.memory = memory
+        self._stages = {}
+        self._nested = set()
+
+    # Times the enclosed block as stage name. Repeated stages are merged: seconds add up and the
+    # largest peak is kept. Peaks are measured above the memory in use when the stage starts;
+    # allocations made in worker processes are not seen.
+    @contextmanager
+    def stage(self, name):
+        tracing = self.memory
+        if tracing:
+            started = not tracemalloc.is_tracing()
+            if started:
+                tracemalloc.start()
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak = None
+            if tracing:
+                peak = max(0, tracemalloc.get_traced_memory()[1] - base)
+                if started:
+                    tracemalloc.stop()
+            self._add(name, seconds, peak)
+
+    # Wraps a progress callback so the time spent inside it (e.g. a job's cancellation check) is
+    # recorded as its own stage. That time is also part of the stage that made the call.
+    def wrap_progress(self, progress, name="progress callbacks"):
+        if progress is None:
+            return None
+        self._nested.add(name)
+        def timed(value):
+            start = time.perf_counter()
+            try:
+                progress(value)
+            finally:
+                self._add(name, time.perf_counter() - start, None)
+        return timed
+
+    # Merges one measurement into the named stage.
+    def _add(self, name, seconds, peak):
+        old = self._stages.get(name)
+        if old is None:
+            self._stages[name] = StageRecord(name, seconds, peak, 1)
+        else:
+            peaks = [p for p in (old.peak_bytes, peak) if p is not None]
+            self._stages[name] = StageRecord(name, old.seconds + seconds, max(peaks) if peaks else None, old.calls + 1)
+
+    # Stage records in the order the stages first ran; progress callback time (which overlaps the
+    # stages that made the calls) comes last.
+    @property
+    def records(self):
+        stages = self._stages.values()
+        return [r for r in stages if r.name not in self._nested] + [r for r in stages if r.name in self._nested]
+
+    # Total wall time of the top-level stages.
+    @property
+    def total_seconds(self):
+        return sum(r.seconds for r in self._stages.values() if r.name not in self._nested)
+
+    # Returns the records as plain dicts (e.g. for JSON output).
+    def as_dicts(self):
+        return [r._asdict() for r in self.records]
+
+    # Formats one aligned line per stage.
+    def format_lines(self):
+        return format_stages(self.records)
+
+    # Writes the stage lines to the "myimg.profile" logger, prefixed with label.
+    def log(self, label="", level=logging.INFO):
+        for line in self.format_lines():
+            logger.log(level, "%s%s", f"{label}: " if label else "", line)
+
+# Formats stage records (StageRecords or their as_dicts() form) as one aligned line per stage.
+def format_stages(records):
+    lines = []
+    for r in records:
+        r = StageRecord(**r) if isinstance(r, dict) else r
+        line = f"{r.name:<20}: {r.seconds * 1000:>9.1f} ms"
+        if r.peak_bytes is not None:
+            line += f"  peak {r.peak_bytes / (1024 * 1024):>8.2f} MB"
+        if r.calls > 1:
+            line += f"  ({r.calls} calls)"
+        lines.append(line)
+    return lines
+
+# Returns profile.stage(name), or a do-nothing context when profiling is off.
+def stage(profile, name):
+    if profile is None:
+        return nullcontext()
+    return profile.stage(name)
+
+# Returns progress wrapped for timing when profiling is on, otherwise progress unchanged.
+def wrap_progress(profile, progress):
+    if profile is None:
+        return progress
+    return profile.wrap_progress(progress)